@@ -97,23 +97,25 @@ async def create_grant(
         )
 
     # Create grant
+    now = datetime.utcnow()
     grant = ManualGrant(
         user_id=request.user_id,
         project_id=project.id,
         feature_code=request.feature_code,
-        valid_from=request.valid_from or datetime.utcnow(),
+        valid_from=request.valid_from or now,
         valid_to=request.valid_to,
         reason=request.reason,
         granted_by=admin_user,
-        granted_at=datetime.utcnow(),
+        granted_at=now,
     )
 
     db.add(grant)
-    db.commit()
-    db.refresh(grant)
+    db.flush()
 
-    # Recompute entitlements
+    # Recompute entitlements in the same transaction
     recompute_and_store_entitlements(db, request.user_id, project.id)  # type: ignore[arg-type]
+    db.commit()
+    db.refresh(grant)
 
     return GrantCreateResponse(
         grant_id=grant.id,  # type: ignore[arg-type]
@@ -161,13 +163,14 @@ async def revoke_grant(
     grant.revoked_at = datetime.utcnow()  # type: ignore[assignment]
     grant.revoked_by = admin_user  # type: ignore[assignment]
     grant.revoke_reason = request.revoke_reason  # type: ignore[assignment]
+    # Flush so the recompute's queries see the grant as revoked (the session doesn't autoflush)
+    db.flush()
 
+    # Recompute entitlements in the same transaction
+    recompute_and_store_entitlements(db, grant.user_id, grant.project_id)  # type: ignore[arg-type]
     db.commit()
     db.refresh(grant)
 
-    # Recompute entitlements
-    recompute_and_store_entitlements(db, grant.user_id, grant.project_id)  # type: ignore[arg-type]
-
     return RevokeResponse(
         grant_id=grant.id,  # type: ignore[arg-type]
         revoked_at=grant.revoked_at,  # type: ignore[arg-type]
@@ -1,9 +1,10 @@
 """Redis cache for event deduplication and caching."""
 
-import json
 import logging
+from collections.abc import Iterable
 from datetime import timedelta
 
+import orjson
 import redis
 from redis.exceptions import RedisError
 
@@ -11,6 +12,11 @@ from billing_service.config import settings
 
 logger = logging.getLogger(__name__)
 
+# How long a claimed event stays locked while it is processed; long enough for the
+# Stripe round trips in a processor, short enough that a killed worker's claim
+# expires well before Stripe's retries give up
+EVENT_CLAIM_TTL_SECONDS = 600
+
 # Redis connection pool (singleton)
 _redis_client: redis.Redis | None = None
 
@@ -32,7 +38,7 @@ def get_redis_client() -> redis.Redis:
             _redis_client.ping()
             logger.info("Redis connection established")
         except RedisError as e:
-            logger.error(f"Failed to connect to Redis: {e}")
+            logger.error("Failed to connect to Redis: %s", e)
             raise
 
     return _redis_client
@@ -54,7 +60,7 @@ def is_event_processed(event_id: str) -> bool:
         exists = client.exists(key)
         return bool(exists)
     except RedisError as e:
-        logger.error(f"Redis error checking event: {e}")
+        logger.error("Redis error checking event: %s", e)
         # If Redis fails, assume event not processed (fail open)
         # This allows processing to continue even if Redis is down
         return False
@@ -72,14 +78,61 @@ def mark_event_processed(event_id: str, ttl_hours: int = 48) -> None:
         client = get_redis_client()
         key = f"webhook_event:{event_id}"
         # Store event ID with timestamp
-        value = json.dumps({"event_id": event_id, "processed_at": None}).encode()
+        value = orjson.dumps({"event_id": event_id, "processed_at": None})
         client.setex(key, timedelta(hours=ttl_hours), value)
-        logger.debug(f"Marked event {event_id} as processed")
+        logger.debug("Marked event %s as processed", event_id)
     except RedisError as e:
-        logger.error(f"Redis error marking event: {e}")
+        logger.error("Redis error marking event: %s", e)
         # Don't raise - event processing should continue even if Redis fails
 
 
+def check_and_claim_event(event_id: str, claim_ttl_seconds: int = EVENT_CLAIM_TTL_SECONDS) -> bool:
+    """
+    Atomically claim a Stripe event for processing.
+
+    Uses a single ``SET key value NX EX ttl``: the key is only written if it does
+    not already exist, so exactly one caller can claim a given event and the
+    check and claim happen in one round trip. The claim only lives for a short
+    processing window; callers extend it to the full processed TTL with
+    mark_event_processed once the event succeeds. A worker killed mid-event
+    (OOM, SIGKILL, deploy) therefore blocks Stripe retries for at most
+    ``claim_ttl_seconds`` instead of the 48 hour dedup window. If Redis errors,
+    falls back to is_event_processed, which fails open.
+
+    Args:
+        event_id: Stripe event ID
+        claim_ttl_seconds: Time to live of the processing claim in seconds
+
+    Returns:
+        True if the event was newly claimed, False if it is processed or being processed
+    """
+    key = f"webhook_event:{event_id}"
+    value = orjson.dumps({"event_id": event_id, "processed_at": None})
+    try:
+        client = get_redis_client()
+        claimed = client.set(key, value, nx=True, ex=claim_ttl_seconds)
+        return bool(claimed)
+    except RedisError as e:
+        logger.error("Redis error claiming event: %s", e)
+        return not is_event_processed(event_id)
+
+
+def release_event_claim(event_id: str) -> None:
+    """
+    Release a claim taken by check_and_claim_event so the event can be retried.
+
+    Args:
+        event_id: Stripe event ID
+    """
+    try:
+        client = get_redis_client()
+        client.delete(f"webhook_event:{event_id}")
+        logger.debug("Released claim on event %s", event_id)
+    except RedisError as e:
+        logger.error("Redis error releasing event claim: %s", e)
+        # Don't raise - the claim expires with its TTL
+
+
 def cache_entitlements(
     user_id: str,
     project_id: str,
@@ -98,10 +151,10 @@ def cache_entitlements(
     try:
         client = get_redis_client()
         key = f"entitlements:{project_id}:{user_id}"
-        value = json.dumps(entitlements).encode()
+        value = orjson.dumps(entitlements)
         client.setex(key, timedelta(seconds=ttl_seconds), value)
     except RedisError as e:
-        logger.warning(f"Redis error caching entitlements: {e}")
+        logger.warning("Redis error caching entitlements: %s", e)
         # Don't raise - caching is optional
 
 
@@ -124,13 +177,13 @@ def get_cached_entitlements(
         key = f"entitlements:{project_id}:{user_id}"
         value = client.get(key)
         if value:
-            return json.loads(value.decode())
+            return orjson.loads(value)
         return None
     except RedisError as e:
-        logger.warning(f"Redis error getting cached entitlements: {e}")
+        logger.warning("Redis error getting cached entitlements: %s", e)
         return None
-    except (json.JSONDecodeError, UnicodeDecodeError) as e:
-        logger.warning(f"Error decoding cached entitlements: {e}")
+    except orjson.JSONDecodeError as e:
+        logger.warning("Error decoding cached entitlements: %s", e)
         return None
 
 
@@ -145,8 +198,29 @@ def invalidate_entitlements_cache(user_id: str, project_id: str) -> None:
     try:
         client = get_redis_client()
         key = f"entitlements:{project_id}:{user_id}"
-        client.delete(key)
-        logger.debug(f"Invalidated entitlements cache for {user_id} in {project_id}")
+        # UNLINK reclaims the value's memory in a background thread
+        client.unlink(key)
+        logger.debug("Invalidated entitlements cache for %s in %s", user_id, project_id)
+    except RedisError as e:
+        logger.warning("Redis error invalidating cache: %s", e)
+        # Don't raise - cache invalidation is best-effort
+
+
+def invalidate_entitlements_caches(keys: Iterable[tuple[str, str]]) -> None:
+    """
+    Invalidate cached entitlements for several users in one round trip (a single UNLINK).
+
+    Args:
+        keys: (user_id, project_id) pairs to invalidate
+    """
+    cache_keys = [f"entitlements:{project_id}:{user_id}" for user_id, project_id in keys]
+    if not cache_keys:
+        return
+
+    try:
+        client = get_redis_client()
+        client.unlink(*cache_keys)
+        logger.debug("Invalidated %d entitlements cache entries", len(cache_keys))
     except RedisError as e:
-        logger.warning(f"Redis error invalidating cache: {e}")
+        logger.warning("Redis error invalidating cache: %s", e)
         # Don't raise - cache invalidation is best-effort
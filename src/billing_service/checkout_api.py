@@ -4,12 +4,17 @@ from datetime import datetime
 from typing import Literal, cast
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 
 from billing_service.auth import verify_project_api_key
 from billing_service.database import get_db
-from billing_service.models import Price, Project
-from billing_service.schemas import CheckoutCreateRequest, CheckoutCreateResponse
+from billing_service.models import Price, Product, Project
+from billing_service.schemas import (
+    CHECKOUT_CREATE_RESPONSE_ADAPTER,
+    CheckoutCreateRequest,
+    CheckoutCreateResponse,
+)
 from billing_service.stripe_service import create_checkout_session
 
 router = APIRouter(prefix="/api/v1/checkout", tags=["checkout"])
@@ -20,7 +25,7 @@ async def create_checkout(
     request: CheckoutCreateRequest,
     project: Project = Depends(verify_project_api_key),
     db: Session = Depends(get_db),
-):
+) -> Response:
     """Create a Stripe checkout session."""
     # Verify price exists and belongs to project
     price = (
@@ -28,7 +33,7 @@ async def create_checkout(
         .join(Price.product)
         .filter(
             Price.id == request.price_id,
-            Price.product.has(project_id=project.id),
+            Product.project_id == project.id,
         )
         .first()
     )
@@ -61,8 +66,12 @@ async def create_checkout(
             detail=f"Failed to create checkout session: {str(e)}",
         ) from e
 
-    return CheckoutCreateResponse(
+    response = CheckoutCreateResponse(
         checkout_url=session.url or "",
         session_id=session.id,
         expires_at=datetime.fromtimestamp(session.expires_at),
     )
+    return Response(
+        content=CHECKOUT_CREATE_RESPONSE_ADAPTER.dump_json(response),
+        media_type="application/json",
+    )
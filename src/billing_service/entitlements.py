@@ -4,7 +4,7 @@ import logging
 from datetime import datetime
 from uuid import UUID
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, contains_eager
 
 from billing_service.models import (
     Entitlement,
@@ -48,6 +48,7 @@ def compute_entitlements_for_user(
         db.query(Subscription)
         .join(Price, Subscription.price_id == Price.id)
         .join(Product, Price.product_id == Product.id)
+        .options(contains_eager(Subscription.price).contains_eager(Price.product))
         .filter(
             Subscription.user_id == user_id,
             Subscription.project_id == project_id,
@@ -57,15 +58,15 @@ def compute_entitlements_for_user(
     )
 
     for subscription in active_subscriptions:
-        # Get product through price relationship
+        # Price and product are populated from the joins above (no extra queries)
         price = subscription.price  # type: ignore
         if not price:
-            logger.warning(f"Price not found for subscription {subscription.stripe_subscription_id}")
+            logger.warning("Price not found for subscription %s", subscription.stripe_subscription_id)
             continue
 
         product = price.product  # type: ignore
         if not product or not product.feature_codes:
-            logger.warning(f"Product not found or has no features for subscription {subscription.stripe_subscription_id}")
+            logger.warning("Product not found or has no features for subscription %s", subscription.stripe_subscription_id)
             continue
 
         # Determine validity period
@@ -100,6 +101,7 @@ def compute_entitlements_for_user(
         db.query(Purchase)
         .join(Price, Purchase.price_id == Price.id)
         .join(Product, Price.product_id == Product.id)
+        .options(contains_eager(Purchase.price).contains_eager(Price.product))
         .filter(
             Purchase.user_id == user_id,
             Purchase.project_id == project_id,
@@ -109,15 +111,15 @@ def compute_entitlements_for_user(
     )
 
     for purchase in succeeded_purchases:
-        # Get product through price relationship
+        # Price and product are populated from the joins above (no extra queries)
         price = purchase.price  # type: ignore
         if not price:
-            logger.warning(f"Price not found for purchase {purchase.stripe_charge_id}")
+            logger.warning("Price not found for purchase %s", purchase.stripe_charge_id)
             continue
 
         product = price.product  # type: ignore
         if not product or not product.feature_codes:
-            logger.warning(f"Product not found or has no features for purchase {purchase.stripe_charge_id}")
+            logger.warning("Product not found or has no features for purchase %s", purchase.stripe_charge_id)
             continue
 
         # Determine validity period
@@ -185,6 +187,8 @@ def recompute_and_store_entitlements(db: Session, user_id: str, project_id: UUID
     2. Deletes old entitlements for this user/project
     3. Stores new entitlements
 
+    Changes are flushed but not committed, so they land in the caller's transaction.
+
     Args:
         db: Database session
         user_id: User identifier
@@ -203,7 +207,10 @@ def recompute_and_store_entitlements(db: Session, user_id: str, project_id: UUID
     for entitlement in new_entitlements:
         db.add(entitlement)
 
-    db.commit()
+    db.flush()
     logger.info(
-        f"Recomputed {len(new_entitlements)} entitlements for user {user_id} in project {project_id}"
+        "Recomputed %d entitlements for user %s in project %s",
+        len(new_entitlements),
+        user_id,
+        project_id,
     )
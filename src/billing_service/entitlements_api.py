@@ -3,6 +3,7 @@
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, Query
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 
 from billing_service.auth import verify_project_api_key
@@ -12,7 +13,12 @@ from billing_service.cache import (
 )
 from billing_service.database import get_db
 from billing_service.models import Entitlement, Project
-from billing_service.schemas import EntitlementResponse, EntitlementsQueryResponse
+from billing_service.prometheus_metrics import entitlements_cache_total
+from billing_service.schemas import (
+    ENTITLEMENTS_QUERY_RESPONSE_ADAPTER,
+    EntitlementResponse,
+    EntitlementsQueryResponse,
+)
 
 router = APIRouter(prefix="/api/v1/entitlements", tags=["entitlements"])
 
@@ -22,33 +28,22 @@ async def get_entitlements(
     user_id: str = Query(..., description="User identifier"),
     project: Project = Depends(verify_project_api_key),
     db: Session = Depends(get_db),
-):
+) -> Response:
     """Get entitlements for a user in a project."""
     # Try to get from cache first
     cache_key_project_id = str(project.project_id)
     cached_data = get_cached_entitlements(user_id, cache_key_project_id)
 
     if cached_data:
-        # Return cached entitlements
-        entitlement_responses = [
-            EntitlementResponse(
-                feature_code=ent["feature_code"],
-                is_active=ent["is_active"],
-                valid_from=datetime.fromisoformat(ent["valid_from"]) if isinstance(ent["valid_from"], str) else ent["valid_from"],
-                valid_to=datetime.fromisoformat(ent["valid_to"]) if ent.get("valid_to") and isinstance(ent["valid_to"], str) else ent.get("valid_to"),
-                source=ent["source"],
-            )
-            for ent in cached_data
-        ]
+        entitlements_cache_total.labels(result="hit").inc()
 
-        return EntitlementsQueryResponse(
-            user_id=user_id,
-            project_id=cache_key_project_id,
-            entitlements=entitlement_responses,
-            checked_at=datetime.utcnow(),
-        )
+        # Return cached entitlements; Pydantic parses the ISO timestamps natively
+        entitlement_responses = [EntitlementResponse.model_validate(ent) for ent in cached_data]
+
+        return _entitlements_response(user_id, cache_key_project_id, entitlement_responses)
 
     # Cache miss - query database
+    entitlements_cache_total.labels(result="miss").inc()
     entitlements = (
         db.query(Entitlement)
         .filter(
@@ -84,9 +79,22 @@ async def get_entitlements(
     ]
     cache_entitlements(user_id, cache_key_project_id, cache_data, ttl_seconds=300)
 
-    return EntitlementsQueryResponse(
+    return _entitlements_response(user_id, cache_key_project_id, entitlement_responses)
+
+
+def _entitlements_response(
+    user_id: str,
+    project_id: str,
+    entitlements: list[EntitlementResponse],
+) -> Response:
+    """Build the pre-encoded JSON response for an entitlements query."""
+    response = EntitlementsQueryResponse(
         user_id=user_id,
-        project_id=cache_key_project_id,
-        entitlements=entitlement_responses,
+        project_id=project_id,
+        entitlements=entitlements,
         checked_at=datetime.utcnow(),
     )
+    return Response(
+        content=ENTITLEMENTS_QUERY_RESPONSE_ADAPTER.dump_json(response),
+        media_type="application/json",
+    )
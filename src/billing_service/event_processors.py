@@ -2,12 +2,16 @@
 
 import logging
 import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
 from datetime import datetime
 
 import stripe
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from billing_service.cache import invalidate_entitlements_cache
+from billing_service.cache import invalidate_entitlements_caches
 from billing_service.config import settings
 from billing_service.database import SessionLocal
 from billing_service.entitlements import recompute_and_store_entitlements
@@ -23,6 +27,81 @@ from billing_service.webhook_processors import BaseEventProcessor
 
 logger = logging.getLogger(__name__)
 
+# Session.info key holding the (user_id, project_id) pairs whose entitlements need refreshing
+ENTITLEMENT_REFRESH_KEY = "entitlement_refresh"
+
+
+def queue_entitlement_refresh(db: Session, user_id: str, project_id: uuid.UUID) -> None:
+    """
+    Queue an entitlements recompute and cache invalidation for a user.
+
+    Refreshes are deduplicated per session and applied by flush_entitlement_refreshes.
+
+    Args:
+        db: Database session the change was made in
+        user_id: User identifier
+        project_id: Project UUID
+    """
+    db.info.setdefault(ENTITLEMENT_REFRESH_KEY, set()).add((user_id, project_id))
+
+
+def flush_entitlement_refreshes(db: Session) -> set[tuple[str, uuid.UUID]]:
+    """
+    Recompute entitlements for every queued user.
+
+    Args:
+        db: Database session with queued refreshes
+
+    Returns:
+        (user_id, project_id) pairs that were recomputed; their cache entries are
+        stale once the session commits
+    """
+    pending: set[tuple[str, uuid.UUID]] = db.info.pop(ENTITLEMENT_REFRESH_KEY, set())
+    for user_id, project_id in pending:
+        recompute_and_store_entitlements(db, user_id, project_id)
+    return pending
+
+
+def release_connection(db: Session) -> None:
+    """
+    Return the session's pooled connection before a slow Stripe API call.
+
+    Only valid while the session has made reads but no writes: the read-only
+    transaction is ended, and the next query checks a connection out again.
+
+    Args:
+        db: Database session
+    """
+    db.rollback()
+
+
+@contextmanager
+def processor_session() -> Iterator[Session]:
+    """
+    Open a database session for processing one event.
+
+    Processors only flush their changes. When the processor finishes without error,
+    queued entitlement refreshes are applied, everything is committed once and the
+    affected cache entries are invalidated; otherwise the transaction is rolled back
+    so Stripe can retry the event.
+
+    Yields:
+        Database session
+    """
+    db = SessionLocal()
+    try:
+        yield db
+        refreshed = flush_entitlement_refreshes(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    # Invalidate only after commit so readers cannot re-cache the old entitlements
+    invalidate_entitlements_caches((user_id, str(project_id)) for user_id, project_id in refreshed)
+
 
 class CheckoutSessionCompletedProcessor(BaseEventProcessor):
     """Process checkout.session.completed events."""
@@ -34,9 +113,7 @@ class CheckoutSessionCompletedProcessor(BaseEventProcessor):
     def process(self, event: stripe.Event) -> None:
         """Process checkout.session.completed event."""
         session_obj = event.data.object
-        db = SessionLocal()
-
-        try:
+        with processor_session() as db:
             # Extract metadata - Stripe objects can be accessed as attributes
             metadata = getattr(session_obj, "metadata", {})
             if isinstance(metadata, dict):
@@ -58,7 +135,8 @@ class CheckoutSessionCompletedProcessor(BaseEventProcessor):
             project = db.query(Project).filter(Project.project_id == project_id_str).first()
             if not project:
                 logger.error(
-                    f"Project not found: {project_id_str}",
+                    "Project not found: %s",
+                    project_id_str,
                     extra={"event_id": event.id},
                 )
                 return
@@ -70,13 +148,11 @@ class CheckoutSessionCompletedProcessor(BaseEventProcessor):
                 self._process_payment(session_obj, user_id, project.id, db)  # type: ignore[arg-type]
             else:
                 logger.warning(
-                    f"Unknown checkout mode: {mode}",
+                    "Unknown checkout mode: %s",
+                    mode,
                     extra={"event_id": event.id},
                 )
 
-        finally:
-            db.close()
-
     def _process_subscription(
         self,
         session_obj: stripe.checkout.Session,
@@ -98,22 +174,23 @@ class CheckoutSessionCompletedProcessor(BaseEventProcessor):
             .first()
         )
         if existing:
-            logger.info(f"Subscription {subscription_id} already exists, skipping")
+            logger.info("Subscription %s already exists, skipping", subscription_id)
             return
 
-        # Retrieve subscription from Stripe
+        # Retrieve subscription from Stripe without holding a database connection
+        release_connection(db)
         stripe.api_key = settings.stripe_secret_key
         try:
             stripe_subscription = stripe.Subscription.retrieve(subscription_id)
         except Exception as e:
-            logger.error(f"Failed to retrieve subscription from Stripe: {e}")
+            logger.error("Failed to retrieve subscription from Stripe: %s", e)
             raise
 
         # Find price
         price_stripe_id = stripe_subscription.items.data[0].price.id
         price = db.query(Price).filter(Price.stripe_price_id == price_stripe_id).first()
         if not price:
-            logger.error(f"Price not found: {price_stripe_id}")
+            logger.error("Price not found: %s", price_stripe_id)
             return
 
         # Map Stripe status to our enum
@@ -156,16 +233,29 @@ class CheckoutSessionCompletedProcessor(BaseEventProcessor):
         )
 
         db.add(subscription)
-        db.commit()
-
-        # Recompute entitlements
-        recompute_and_store_entitlements(db, user_id, project_id)
+        try:
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+            # Only a concurrent delivery inserting the same subscription is safe to skip;
+            # any other constraint failure propagates so the claim is released and Stripe retries
+            duplicate = (
+                db.query(Subscription.id)
+                .filter(Subscription.stripe_subscription_id == subscription_id)
+                .first()
+            )
+            if not duplicate:
+                raise
+            logger.info("Subscription %s already exists, skipping", subscription_id)
+            return
 
-        # Invalidate entitlements cache
-        invalidate_entitlements_cache(user_id, str(project_id))
+        # Recompute entitlements and invalidate the cache once processing succeeds
+        queue_entitlement_refresh(db, user_id, project_id)
 
         logger.info(
-            f"Created subscription {subscription_id} for user {user_id}",
+            "Created subscription %s for user %s",
+            subscription_id,
+            user_id,
             extra={"subscription_id": subscription_id, "user_id": user_id},
         )
 
@@ -183,18 +273,19 @@ class CheckoutSessionCompletedProcessor(BaseEventProcessor):
             logger.error("No payment_intent in checkout session", extra={"session_id": session_id})
             return
 
-        # Retrieve payment intent from Stripe
+        # Retrieve payment intent from Stripe without holding a database connection
+        release_connection(db)
         stripe.api_key = settings.stripe_secret_key
         try:
             payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
         except Exception as e:
-            logger.error(f"Failed to retrieve payment intent from Stripe: {e}")
+            logger.error("Failed to retrieve payment intent from Stripe: %s", e)
             raise
 
         # Get charge ID - payment_intent is a Stripe object
         charges = getattr(payment_intent.charges, "data", []) if hasattr(payment_intent, "charges") else []
         if not charges:
-            logger.error(f"No charges found in payment intent {payment_intent_id}")
+            logger.error("No charges found in payment intent %s", payment_intent_id)
             return
 
         charge_id = charges[0].id
@@ -202,7 +293,7 @@ class CheckoutSessionCompletedProcessor(BaseEventProcessor):
         # Check if purchase already exists (idempotency)
         existing = db.query(Purchase).filter(Purchase.stripe_charge_id == charge_id).first()
         if existing:
-            logger.info(f"Purchase {charge_id} already exists, skipping")
+            logger.info("Purchase %s already exists, skipping", charge_id)
             return
 
         # Find price from line items
@@ -212,6 +303,7 @@ class CheckoutSessionCompletedProcessor(BaseEventProcessor):
             logger.error("No session ID found")
             return
 
+        release_connection(db)
         try:
             expanded_session = stripe.checkout.Session.retrieve(
                 session_id,
@@ -219,7 +311,7 @@ class CheckoutSessionCompletedProcessor(BaseEventProcessor):
             )
             line_items = expanded_session.line_items.data if expanded_session.line_items else []
         except Exception as e:
-            logger.error(f"Failed to retrieve checkout session: {e}")
+            logger.error("Failed to retrieve checkout session: %s", e)
             return
 
         if not line_items:
@@ -229,7 +321,7 @@ class CheckoutSessionCompletedProcessor(BaseEventProcessor):
         price_stripe_id = line_items[0].price.id
         price = db.query(Price).filter(Price.stripe_price_id == price_stripe_id).first()
         if not price:
-            logger.error(f"Price not found: {price_stripe_id}")
+            logger.error("Price not found: %s", price_stripe_id)
             return
 
         # Determine status
@@ -250,16 +342,25 @@ class CheckoutSessionCompletedProcessor(BaseEventProcessor):
         )
 
         db.add(purchase)
-        db.commit()
-
-        # Recompute entitlements
-        recompute_and_store_entitlements(db, user_id, project_id)
+        try:
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+            # Only a concurrent delivery inserting the same purchase is safe to skip;
+            # any other constraint failure propagates so the claim is released and Stripe retries
+            duplicate = db.query(Purchase.id).filter(Purchase.stripe_charge_id == charge_id).first()
+            if not duplicate:
+                raise
+            logger.info("Purchase %s already exists, skipping", charge_id)
+            return
 
-        # Invalidate entitlements cache
-        invalidate_entitlements_cache(user_id, str(project_id))
+        # Recompute entitlements and invalidate the cache once processing succeeds
+        queue_entitlement_refresh(db, user_id, project_id)
 
         logger.info(
-            f"Created purchase {charge_id} for user {user_id}",
+            "Created purchase %s for user %s",
+            charge_id,
+            user_id,
             extra={"charge_id": charge_id, "user_id": user_id},
         )
 
@@ -274,49 +375,40 @@ class InvoicePaymentSucceededProcessor(BaseEventProcessor):
     def process(self, event: stripe.Event) -> None:
         """Process invoice.payment_succeeded event."""
         invoice = event.data.object
-        db = SessionLocal()
-
-        try:
+        with processor_session() as db:
             subscription_id = getattr(invoice, "subscription", None)
             if not subscription_id:
                 logger.warning("Invoice has no subscription, skipping")
                 return
 
-            # Find subscription
-            subscription = (
-                db.query(Subscription)
-                .filter(Subscription.stripe_subscription_id == subscription_id)
-                .first()
-            )
-
-            if not subscription:
-                logger.warning(f"Subscription not found: {subscription_id}")
-                return
-
-            # Update subscription period
+            # Update subscription period and fetch the owner in a single round trip
             period_start = datetime.fromtimestamp(getattr(invoice, "period_start", 0))
             period_end = datetime.fromtimestamp(getattr(invoice, "period_end", 0))
 
-            subscription.current_period_start = period_start  # type: ignore[assignment]
-            subscription.current_period_end = period_end  # type: ignore[assignment]
-            subscription.status = SubscriptionStatus.ACTIVE  # type: ignore[assignment]
-
-            db.commit()
+            subscription = db.execute(
+                update(Subscription)
+                .where(Subscription.stripe_subscription_id == subscription_id)
+                .values(
+                    current_period_start=period_start,
+                    current_period_end=period_end,
+                    status=SubscriptionStatus.ACTIVE,
+                )
+                .returning(Subscription.user_id, Subscription.project_id)
+            ).first()
 
-            # Recompute entitlements
-            recompute_and_store_entitlements(db, str(subscription.user_id), subscription.project_id)  # type: ignore[arg-type]
+            if not subscription:
+                logger.warning("Subscription not found: %s", subscription_id)
+                return
 
-            # Invalidate entitlements cache
-            invalidate_entitlements_cache(str(subscription.user_id), str(subscription.project_id))
+            # Recompute entitlements and invalidate the cache once processing succeeds
+            queue_entitlement_refresh(db, subscription.user_id, subscription.project_id)
 
             logger.info(
-                f"Updated subscription {subscription_id} period",
+                "Updated subscription %s period",
+                subscription_id,
                 extra={"subscription_id": subscription_id},
             )
 
-        finally:
-            db.close()
-
 
 class CustomerSubscriptionUpdatedProcessor(BaseEventProcessor):
     """Process customer.subscription.updated events."""
@@ -328,25 +420,12 @@ class CustomerSubscriptionUpdatedProcessor(BaseEventProcessor):
     def process(self, event: stripe.Event) -> None:
         """Process customer.subscription.updated event."""
         stripe_subscription = event.data.object
-        db = SessionLocal()
-
-        try:
+        with processor_session() as db:
             subscription_id = getattr(stripe_subscription, "id", None)
             if not subscription_id:
                 logger.error("Subscription ID not found in event")
                 return
 
-            # Find subscription
-            subscription = (
-                db.query(Subscription)
-                .filter(Subscription.stripe_subscription_id == subscription_id)
-                .first()
-            )
-
-            if not subscription:
-                logger.warning(f"Subscription not found: {subscription_id}")
-                return
-
             # Map Stripe status to our enum
             status_map = {
                 "active": SubscriptionStatus.ACTIVE,
@@ -358,30 +437,34 @@ class CustomerSubscriptionUpdatedProcessor(BaseEventProcessor):
             stripe_status = getattr(stripe_subscription, "status", "active")
             status = status_map.get(stripe_status, SubscriptionStatus.ACTIVE)
 
-            # Update subscription
-            subscription.status = status  # type: ignore[assignment]
-            subscription.current_period_start = datetime.fromtimestamp(getattr(stripe_subscription, "current_period_start", 0))  # type: ignore[assignment]
-            subscription.current_period_end = datetime.fromtimestamp(getattr(stripe_subscription, "current_period_end", 0))  # type: ignore[assignment]
-            subscription.cancel_at_period_end = getattr(stripe_subscription, "cancel_at_period_end", False) or False  # type: ignore[assignment]
+            # Update subscription and fetch the owner in a single round trip
             canceled_at_ts = getattr(stripe_subscription, "canceled_at", None)
-            subscription.canceled_at = datetime.fromtimestamp(canceled_at_ts) if canceled_at_ts else None  # type: ignore[assignment]
-
-            db.commit()
+            subscription = db.execute(
+                update(Subscription)
+                .where(Subscription.stripe_subscription_id == subscription_id)
+                .values(
+                    status=status,
+                    current_period_start=datetime.fromtimestamp(getattr(stripe_subscription, "current_period_start", 0)),
+                    current_period_end=datetime.fromtimestamp(getattr(stripe_subscription, "current_period_end", 0)),
+                    cancel_at_period_end=getattr(stripe_subscription, "cancel_at_period_end", False) or False,
+                    canceled_at=datetime.fromtimestamp(canceled_at_ts) if canceled_at_ts else None,
+                )
+                .returning(Subscription.user_id, Subscription.project_id)
+            ).first()
 
-            # Recompute entitlements
-            recompute_and_store_entitlements(db, str(subscription.user_id), subscription.project_id)  # type: ignore[arg-type]
+            if not subscription:
+                logger.warning("Subscription not found: %s", subscription_id)
+                return
 
-            # Invalidate entitlements cache
-            invalidate_entitlements_cache(str(subscription.user_id), str(subscription.project_id))
+            # Recompute entitlements and invalidate the cache once processing succeeds
+            queue_entitlement_refresh(db, subscription.user_id, subscription.project_id)
 
             logger.info(
-                f"Updated subscription {subscription_id}",
+                "Updated subscription %s",
+                subscription_id,
                 extra={"subscription_id": subscription_id, "status": status.value},
             )
 
-        finally:
-            db.close()
-
 
 class CustomerSubscriptionDeletedProcessor(BaseEventProcessor):
     """Process customer.subscription.deleted events."""
@@ -393,49 +476,37 @@ class CustomerSubscriptionDeletedProcessor(BaseEventProcessor):
     def process(self, event: stripe.Event) -> None:
         """Process customer.subscription.deleted event."""
         stripe_subscription = event.data.object
-        db = SessionLocal()
-
-        try:
+        with processor_session() as db:
             subscription_id = getattr(stripe_subscription, "id", None)
             if not subscription_id:
                 logger.error("Subscription ID not found in event")
                 return
 
-            # Find subscription
-            subscription = (
-                db.query(Subscription)
-                .filter(Subscription.stripe_subscription_id == subscription_id)
-                .first()
-            )
+            # Mark as canceled in a single UPDATE ... RETURNING
+            subscription = db.execute(
+                update(Subscription)
+                .where(Subscription.stripe_subscription_id == subscription_id)
+                .values(
+                    status=SubscriptionStatus.CANCELED,
+                    canceled_at=datetime.utcnow(),
+                    cancel_at_period_end=False,
+                )
+                .returning(Subscription.user_id, Subscription.project_id)
+            ).first()
 
             if not subscription:
-                logger.warning(f"Subscription not found: {subscription_id}")
+                logger.warning("Subscription not found: %s", subscription_id)
                 return
 
-            user_id = str(subscription.user_id)
-            project_id = subscription.project_id
-
-            # Mark as canceled
-            subscription.status = SubscriptionStatus.CANCELED  # type: ignore[assignment]
-            subscription.canceled_at = datetime.utcnow()  # type: ignore[assignment]
-            subscription.cancel_at_period_end = False  # type: ignore[assignment]
-
-            db.commit()
-
-            # Recompute entitlements
-            recompute_and_store_entitlements(db, user_id, project_id)  # type: ignore[arg-type]
-
-            # Invalidate entitlements cache
-            invalidate_entitlements_cache(user_id, str(project_id))
+            # Recompute entitlements and invalidate the cache once processing succeeds
+            queue_entitlement_refresh(db, subscription.user_id, subscription.project_id)
 
             logger.info(
-                f"Marked subscription {subscription_id} as canceled",
+                "Marked subscription %s as canceled",
+                subscription_id,
                 extra={"subscription_id": subscription_id},
             )
 
-        finally:
-            db.close()
-
 
 class ChargeRefundedProcessor(BaseEventProcessor):
     """Process charge.refunded events."""
@@ -447,37 +518,30 @@ class ChargeRefundedProcessor(BaseEventProcessor):
     def process(self, event: stripe.Event) -> None:
         """Process charge.refunded event."""
         charge = event.data.object
-        db = SessionLocal()
-
-        try:
+        with processor_session() as db:
             charge_id = getattr(charge, "id", None)
             if not charge_id:
                 logger.error("Charge ID not found in event")
                 return
 
-            # Find purchase
-            purchase = db.query(Purchase).filter(Purchase.stripe_charge_id == charge_id).first()
+            # Mark purchase as refunded in a single UPDATE ... RETURNING
+            purchase = db.execute(
+                update(Purchase)
+                .where(Purchase.stripe_charge_id == charge_id)
+                .values(status=PurchaseStatus.REFUNDED, refunded_at=datetime.utcnow())
+                .returning(Purchase.user_id, Purchase.project_id)
+            ).first()
 
             if not purchase:
-                logger.warning(f"Purchase not found for charge: {charge_id}")
+                logger.warning("Purchase not found for charge: %s", charge_id)
                 return
 
-            # Update purchase status
-            purchase.status = PurchaseStatus.REFUNDED  # type: ignore[assignment]
-            purchase.refunded_at = datetime.utcnow()  # type: ignore[assignment]
-
-            db.commit()
-
-            # Recompute entitlements
-            recompute_and_store_entitlements(db, str(purchase.user_id), purchase.project_id)  # type: ignore[arg-type]
-
-            # Invalidate entitlements cache
-            invalidate_entitlements_cache(str(purchase.user_id), str(purchase.project_id))
+            # Recompute entitlements and invalidate the cache once processing succeeds
+            queue_entitlement_refresh(db, purchase.user_id, purchase.project_id)
 
             logger.info(
-                f"Marked purchase {charge_id} as refunded",
+                "Marked purchase %s as refunded",
+                charge_id,
                 extra={"charge_id": charge_id},
             )
 
-        finally:
-            db.close()
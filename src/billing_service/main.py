@@ -1,5 +1,8 @@
 """Main FastAPI application entry point."""
 
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
@@ -33,11 +36,25 @@ event_router.register_processor(InvoicePaymentSucceededProcessor())
 event_router.register_processor(CustomerSubscriptionUpdatedProcessor())
 event_router.register_processor(CustomerSubscriptionDeletedProcessor())
 event_router.register_processor(ChargeRefundedProcessor())
+event_router.freeze()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Start background tasks on startup and clean them up on shutdown."""
+    # The scheduler runs on this event loop, so it is started here rather than at import
+    start_reconciliation_scheduler()
+    try:
+        yield
+    finally:
+        stop_reconciliation_scheduler()
+
 
 app = FastAPI(
     title="Billing Service",
     description="Centralized Billing & Entitlements Service",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # CORS middleware
@@ -86,15 +103,3 @@ async def liveness_check() -> HealthResponse:
     """Liveness check endpoint."""
     return HealthResponse(status="alive")
 
-
-# Start reconciliation scheduler on startup
-@app.on_event("startup")
-async def startup_event() -> None:
-    """Start background tasks on application startup."""
-    start_reconciliation_scheduler()
-
-
-@app.on_event("shutdown")
-async def shutdown_event() -> None:
-    """Cleanup on application shutdown."""
-    stop_reconciliation_scheduler()
@@ -4,13 +4,18 @@ from datetime import datetime
 
 import stripe
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 
 from billing_service.auth import verify_project_api_key
 from billing_service.config import settings
 from billing_service.database import get_db
 from billing_service.models import Project, Subscription
-from billing_service.schemas import PortalCreateRequest, PortalCreateResponse
+from billing_service.schemas import (
+    PORTAL_CREATE_RESPONSE_ADAPTER,
+    PortalCreateRequest,
+    PortalCreateResponse,
+)
 from billing_service.stripe_service import create_portal_session as create_stripe_portal_session
 
 router = APIRouter(prefix="/api/v1/portal", tags=["portal"])
@@ -21,7 +26,7 @@ async def create_portal_session_endpoint(
     request: PortalCreateRequest,
     project: Project = Depends(verify_project_api_key),
     db: Session = Depends(get_db),
-):
+) -> Response:
     """Create a Stripe Customer Portal session."""
     # Find user's active subscription to get Stripe customer ID
     subscription = (
@@ -58,7 +63,11 @@ async def create_portal_session_endpoint(
             detail=f"Failed to create portal session: {str(e)}",
         ) from e
 
-    return PortalCreateResponse(
+    response = PortalCreateResponse(
         portal_url=session.url,
         expires_at=datetime.fromtimestamp(getattr(session, "expires_at", 0)),
     )
+    return Response(
+        content=PORTAL_CREATE_RESPONSE_ADAPTER.dump_json(response),
+        media_type="application/json",
+    )
@@ -1,8 +1,21 @@
 """Prometheus metrics endpoint for operational monitoring."""
 
+import asyncio
+import os
+import time
+
 from fastapi import APIRouter
 from fastapi.responses import Response
-from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.multiprocess import MultiProcessCollector
 
 router = APIRouter(prefix="/metrics", tags=["metrics"])
 
@@ -52,14 +65,10 @@ active_subscriptions_total = Gauge(
     ["project_id", "status"]
 )
 
-entitlements_cache_hits_total = Counter(
-    "entitlements_cache_hits_total",
-    "Total number of entitlements cache hits"
-)
-
-entitlements_cache_misses_total = Counter(
-    "entitlements_cache_misses_total",
-    "Total number of entitlements cache misses"
+entitlements_cache_total = Counter(
+    "entitlements_cache_total",
+    "Total number of entitlements cache lookups",
+    ["result"]
 )
 
 webhook_events_processed_total = Counter(
@@ -80,6 +89,33 @@ reconciliation_duration_seconds = Histogram(
 )
 
 
+# Encoded exposition payload is reused for this many seconds (kept well below
+# the scrape interval) so concurrent scrapers share a single encode.
+METRICS_CACHE_TTL_SECONDS = 1.0
+
+_metrics_body = b""
+_metrics_generated_at = float("-inf")
+_metrics_lock = asyncio.Lock()
+
+
+def get_scrape_registry() -> CollectorRegistry:
+    """
+    Get the registry to expose on /metrics.
+
+    When running under multiple uvicorn workers, PROMETHEUS_MULTIPROC_DIR must be
+    set so that samples from every worker process are aggregated on scrape.
+
+    Returns:
+        Registry to encode for Prometheus
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    return registry
+
+
 @router.get("")
 async def get_metrics() -> Response:
     """
@@ -87,7 +123,17 @@ async def get_metrics() -> Response:
 
     Returns metrics in Prometheus text format for scraping.
     """
+    global _metrics_body, _metrics_generated_at
+
+    if time.monotonic() - _metrics_generated_at > METRICS_CACHE_TTL_SECONDS:
+        async with _metrics_lock:
+            # Another scrape may have refreshed the payload while we waited
+            now = time.monotonic()
+            if now - _metrics_generated_at > METRICS_CACHE_TTL_SECONDS:
+                _metrics_body = generate_latest(get_scrape_registry())
+                _metrics_generated_at = now
+
     return Response(
-        content=generate_latest(),
+        content=_metrics_body,
         media_type=CONTENT_TYPE_LATEST
     )
@@ -108,22 +108,27 @@ def reconcile_subscriptions_for_project(db: Session, project: Project) -> tuple[
             # Reconcile
             was_updated = reconcile_subscription(db, subscription, stripe_subscription)
             if was_updated:
+                # Flush the reconciled state first so the recompute's queries see it
+                # (the session doesn't autoflush), then commit both in one transaction
+                db.flush()
+                recompute_and_store_entitlements(db, subscription.user_id, subscription.project_id)
                 db.commit()
                 updated += 1
-                # Recompute entitlements
-                recompute_and_store_entitlements(db, subscription.user_id, subscription.project_id)
             synced += 1
 
         except stripe.error.InvalidRequestError:
             # Subscription doesn't exist in Stripe
             logger.warning(
-                f"Subscription {subscription.stripe_subscription_id} not found in Stripe",
+                "Subscription %s not found in Stripe",
+                subscription.stripe_subscription_id,
                 extra={"subscription_id": subscription.stripe_subscription_id},
             )
             missing += 1
         except Exception as e:
             logger.error(
-                f"Error reconciling subscription {subscription.stripe_subscription_id}: {e}",
+                "Error reconciling subscription %s: %s",
+                subscription.stripe_subscription_id,
+                e,
                 extra={"subscription_id": subscription.stripe_subscription_id},
                 exc_info=True,
             )
@@ -153,7 +158,7 @@ def reconcile_purchase(
         # Charge was refunded but we marked it as refunded - this is correct
         # No action needed, state is already correct
         logger.debug(
-            f"Purchase {purchase.stripe_charge_id} already marked as refunded, no update needed"
+            "Purchase %s already marked as refunded, no update needed", purchase.stripe_charge_id
         )
 
     return updated
@@ -181,22 +186,27 @@ def reconcile_purchases_for_project(db: Session, project: Project) -> tuple[int,
             # Reconcile
             was_updated = reconcile_purchase(db, purchase, stripe_charge)
             if was_updated:
+                # Flush the reconciled state first so the recompute's queries see it
+                # (the session doesn't autoflush), then commit both in one transaction
+                db.flush()
+                recompute_and_store_entitlements(db, purchase.user_id, purchase.project_id)
                 db.commit()
                 updated += 1
-                # Recompute entitlements
-                recompute_and_store_entitlements(db, purchase.user_id, purchase.project_id)
             synced += 1
 
         except stripe.error.InvalidRequestError:
             # Charge doesn't exist in Stripe
             logger.warning(
-                f"Charge {purchase.stripe_charge_id} not found in Stripe",
+                "Charge %s not found in Stripe",
+                purchase.stripe_charge_id,
                 extra={"charge_id": purchase.stripe_charge_id},
             )
             missing += 1
         except Exception as e:
             logger.error(
-                f"Error reconciling purchase {purchase.stripe_charge_id}: {e}",
+                "Error reconciling purchase %s: %s",
+                purchase.stripe_charge_id,
+                e,
                 extra={"charge_id": purchase.stripe_charge_id},
                 exc_info=True,
             )
@@ -219,7 +229,7 @@ def reconcile_all() -> ReconciliationResult:
         projects = db.query(Project).filter(Project.is_active == True).all()  # noqa: E712
 
         for project in projects:
-            logger.info(f"Reconciling project {project.project_id}")
+            logger.info("Reconciling project %s", project.project_id)
 
             # Reconcile subscriptions
             sub_synced, sub_updated, sub_missing = reconcile_subscriptions_for_project(db, project)
@@ -234,17 +244,19 @@ def reconcile_all() -> ReconciliationResult:
             result.purchases_missing_in_stripe += pur_missing
 
         logger.info(
-            f"Reconciliation complete: "
-            f"{result.subscriptions_synced} subscriptions synced, "
-            f"{result.subscriptions_updated} updated, "
-            f"{result.subscriptions_missing_in_stripe} missing; "
-            f"{result.purchases_synced} purchases synced, "
-            f"{result.purchases_updated} updated, "
-            f"{result.purchases_missing_in_stripe} missing"
+            "Reconciliation complete: "
+            "%d subscriptions synced, %d updated, %d missing; "
+            "%d purchases synced, %d updated, %d missing",
+            result.subscriptions_synced,
+            result.subscriptions_updated,
+            result.subscriptions_missing_in_stripe,
+            result.purchases_synced,
+            result.purchases_updated,
+            result.purchases_missing_in_stripe,
         )
 
     except Exception as e:
-        logger.error(f"Error during reconciliation: {e}", exc_info=True)
+        logger.error("Error during reconciliation: %s", e, exc_info=True)
         result.errors.append(str(e))
     finally:
         db.close()
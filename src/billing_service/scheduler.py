@@ -1,29 +1,45 @@
 """Scheduler for periodic reconciliation jobs."""
 
+import asyncio
 import logging
 
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
-from billing_service.reconciliation import reconcile_all
+from billing_service.reconciliation import ReconciliationResult, reconcile_all
 
 logger = logging.getLogger(__name__)
 
-_scheduler: BackgroundScheduler | None = None
+_scheduler: AsyncIOScheduler | None = None
+
+
+async def run_reconciliation_job() -> ReconciliationResult:
+    """
+    Run the daily reconciliation job.
+
+    The job is scheduled on the application's event loop. reconcile_all() still
+    performs blocking Stripe and database I/O, so it runs in a worker thread
+    instead of stalling HTTP handlers sharing the loop.
+    """
+    return await asyncio.to_thread(reconcile_all)
 
 
 def start_reconciliation_scheduler() -> None:
-    """Start the reconciliation scheduler."""
+    """
+    Start the reconciliation scheduler.
+
+    Must be called from within the running event loop (e.g. the FastAPI lifespan).
+    """
     global _scheduler
 
     if _scheduler:
         logger.warning("Reconciliation scheduler already started")
         return
 
-    _scheduler = BackgroundScheduler()
+    _scheduler = AsyncIOScheduler()
     # Run daily at 2 AM UTC
     _scheduler.add_job(
-        reconcile_all,
+        run_reconciliation_job,
         trigger=CronTrigger(hour=2, minute=0),
         id="daily_reconciliation",
         name="Daily Stripe Reconciliation",
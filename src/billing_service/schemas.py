@@ -3,13 +3,15 @@
 from datetime import datetime
 from uuid import UUID
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 
 
 # Checkout Schemas
 class CheckoutCreateRequest(BaseModel):
     """Request schema for creating a checkout session."""
 
+    model_config = ConfigDict(frozen=True)
+
     user_id: str = Field(..., description="User identifier from micro-app")
     price_id: UUID = Field(..., description="Price UUID to purchase")
     mode: str = Field(..., pattern="^(subscription|payment)$", description="Checkout mode")
@@ -20,6 +22,8 @@ class CheckoutCreateRequest(BaseModel):
 class CheckoutCreateResponse(BaseModel):
     """Response schema for checkout session creation."""
 
+    model_config = ConfigDict(frozen=True)
+
     checkout_url: str = Field(..., description="Stripe checkout URL")
     session_id: str = Field(..., description="Stripe checkout session ID")
     expires_at: datetime = Field(..., description="Session expiration timestamp")
@@ -29,6 +33,8 @@ class CheckoutCreateResponse(BaseModel):
 class EntitlementResponse(BaseModel):
     """Response schema for a single entitlement."""
 
+    model_config = ConfigDict(frozen=True)
+
     feature_code: str = Field(..., description="Feature identifier")
     is_active: bool = Field(..., description="Whether entitlement is currently active")
     valid_from: datetime = Field(..., description="Access start timestamp")
@@ -39,6 +45,8 @@ class EntitlementResponse(BaseModel):
 class EntitlementsQueryResponse(BaseModel):
     """Response schema for entitlements query."""
 
+    model_config = ConfigDict(frozen=True)
+
     user_id: str = Field(..., description="User identifier")
     project_id: str = Field(..., description="Project identifier")
     entitlements: list[EntitlementResponse] = Field(..., description="List of entitlements")
@@ -49,6 +57,8 @@ class EntitlementsQueryResponse(BaseModel):
 class PortalCreateRequest(BaseModel):
     """Request schema for creating a portal session."""
 
+    model_config = ConfigDict(frozen=True)
+
     user_id: str = Field(..., description="User identifier from micro-app")
     return_url: str = Field(..., description="URL to return to after portal session")
 
@@ -56,6 +66,8 @@ class PortalCreateRequest(BaseModel):
 class PortalCreateResponse(BaseModel):
     """Response schema for portal session creation."""
 
+    model_config = ConfigDict(frozen=True)
+
     portal_url: str = Field(..., description="Stripe Customer Portal URL")
     expires_at: datetime = Field(..., description="Session expiration timestamp")
 
@@ -64,6 +76,8 @@ class PortalCreateResponse(BaseModel):
 class HealthResponse(BaseModel):
     """Response schema for health check."""
 
+    model_config = ConfigDict(frozen=True)
+
     status: str = Field(..., description="Health status")
 
 
@@ -71,4 +85,13 @@ class HealthResponse(BaseModel):
 class ErrorResponse(BaseModel):
     """Response schema for errors."""
 
+    model_config = ConfigDict(frozen=True)
+
     detail: str = Field(..., description="Error message")
+
+
+# Response serializers. Endpoints on the request hot path return JSON encoded by these
+# module-level adapters directly, so FastAPI skips re-validating the response model.
+CHECKOUT_CREATE_RESPONSE_ADAPTER = TypeAdapter(CheckoutCreateResponse)
+ENTITLEMENTS_QUERY_RESPONSE_ADAPTER = TypeAdapter(EntitlementsQueryResponse)
+PORTAL_CREATE_RESPONSE_ADAPTER = TypeAdapter(PortalCreateResponse)
@@ -2,10 +2,12 @@
 
 import logging
 from abc import ABC, abstractmethod
+from collections.abc import Callable, Mapping
+from types import MappingProxyType
 
 import stripe
 
-from billing_service.cache import is_event_processed, mark_event_processed
+from billing_service.cache import check_and_claim_event, mark_event_processed, release_event_claim
 
 logger = logging.getLogger(__name__)
 
@@ -40,9 +42,12 @@ class BaseEventProcessor(ABC):
 class EventRouter:
     """Router for Stripe webhook events."""
 
-    def __init__(self):
+    def __init__(self) -> None:
         """Initialize event router."""
-        self._processors: dict[str, BaseEventProcessor] = {}
+        # Event type -> bound processor.process, resolved once at registration
+        self._processors: dict[str, Callable[[stripe.Event], None]] = {}
+        # Read-only view of the table, exposed once freeze() ends registration
+        self.processors: Mapping[str, Callable[[stripe.Event], None]] | None = None
 
     def register_processor(self, processor: BaseEventProcessor) -> None:
         """
@@ -50,10 +55,25 @@ class EventRouter:
 
         Args:
             processor: Event processor instance
+
+        Raises:
+            RuntimeError: If the router has already been frozen
         """
+        if self.processors is not None:
+            raise RuntimeError("Cannot register processors after the event router is frozen")
+
         event_type = processor.get_event_type()
-        self._processors[event_type] = processor
-        logger.info(f"Registered processor for event type: {event_type}")
+        self._processors[event_type] = processor.process
+        logger.info("Registered processor for event type: %s", event_type)
+
+    def freeze(self) -> None:
+        """
+        Freeze the processor table once startup registration is complete.
+
+        The dispatch table is read on every webhook and never changes afterwards, so
+        further registrations are rejected and the table is exposed as a read-only view.
+        """
+        self.processors = MappingProxyType(self._processors)
 
     def process_event(self, event: stripe.Event) -> None:
         """
@@ -67,22 +87,27 @@ class EventRouter:
         """
         event_type = event.type
         event_id = event.id
+        log_extra = {"event_id": event_id, "event_type": event_type}
 
-        # Check if event already processed (idempotency)
-        if is_event_processed(event_id):
+        # Claim the event up front (idempotency); a duplicate delivery loses the claim.
+        # The claim is short-lived and only extended to the processed TTL below, so a
+        # worker killed mid-event doesn't leave the event acked as a duplicate for 48h
+        if not check_and_claim_event(event_id):
             logger.info(
-                f"Event {event_id} already processed, skipping",
-                extra={"event_id": event_id, "event_type": event_type},
+                "Event %s already processed, skipping",
+                event_id,
+                extra=log_extra,
             )
             return
 
         # Find processor for this event type
-        processor = self._processors.get(event_type)
+        process = self._processors.get(event_type)
 
-        if not processor:
+        if process is None:
             logger.warning(
-                f"No processor registered for event type: {event_type}",
-                extra={"event_id": event_id, "event_type": event_type},
+                "No processor registered for event type: %s",
+                event_type,
+                extra=log_extra,
             )
             # Mark as processed even if no processor (prevent retries)
             mark_event_processed(event_id)
@@ -91,29 +116,27 @@ class EventRouter:
         try:
             # Process event
             logger.info(
-                f"Processing event {event_id}",
-                extra={"event_id": event_id, "event_type": event_type},
+                "Processing event %s",
+                event_id,
+                extra=log_extra,
             )
-            processor.process(event)
-
-            # Mark as processed after successful processing
+            process(event)
             mark_event_processed(event_id)
             logger.info(
-                f"Successfully processed event {event_id}",
-                extra={"event_id": event_id, "event_type": event_type},
+                "Successfully processed event %s",
+                event_id,
+                extra=log_extra,
             )
 
         except Exception as e:
             logger.error(
-                f"Error processing event {event_id}",
-                extra={
-                    "event_id": event_id,
-                    "event_type": event_type,
-                    "error": str(e),
-                },
+                "Error processing event %s",
+                event_id,
+                extra={**log_extra, "error": str(e)},
                 exc_info=True,
             )
-            # Don't mark as processed on error - allow retry
+            # Release the claim on error - allow retry
+            release_event_claim(event_id)
             raise
 
 
@@ -1,11 +1,38 @@
 """Stripe webhook signature verification."""
 
+import re
+import time
 
 import stripe
 from fastapi import HTTPException, Request, status
 
 from billing_service.config import settings
 
+# Stripe event payloads are a few KB; anything past this is rejected before it is read
+MAX_WEBHOOK_PAYLOAD_BYTES = 1024 * 1024
+
+# Matches stripe.Webhook.DEFAULT_TOLERANCE; like the SDK, only timestamps older than
+# this are rejected (future-dated signatures are left to the HMAC check)
+WEBHOOK_TIMESTAMP_TOLERANCE_SECONDS = 300
+
+
+# The t= element of a Stripe-Signature header, e.g. "t=1492774577,v1=5257a8...,v0=..."
+_SIGNATURE_TIMESTAMP_RE = re.compile(r"(?:^|,)\s*t=(\d+)\s*(?:,|$)")
+
+
+def get_signature_timestamp(signature: str) -> int | None:
+    """
+    Extract the ``t=`` timestamp from a Stripe-Signature header.
+
+    Args:
+        signature: Stripe-Signature header value
+
+    Returns:
+        Signature timestamp, or None if the header has no parseable timestamp
+    """
+    match = _SIGNATURE_TIMESTAMP_RE.search(signature)
+    return int(match.group(1)) if match else None
+
 
 def verify_stripe_signature(
     payload: bytes,
@@ -30,9 +57,20 @@ def verify_stripe_signature(
             detail="Webhook secret not configured",
         )
 
+    # Reject replayed/stale signatures before paying for the HMAC over the payload.
+    # Headers without a parseable timestamp are left for the SDK to reject.
+    timestamp = get_signature_timestamp(signature)
+    if timestamp is not None and timestamp < time.time() - WEBHOOK_TIMESTAMP_TOLERANCE_SECONDS:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid signature: timestamp outside the tolerance zone",
+        )
+
     try:
+        # The SDK verifies the signature over the text body and then parses it; handing
+        # it text decodes the bytes once here instead of once for each step
         event = stripe.Webhook.construct_event(
-            payload,
+            payload.decode("utf-8"),
             signature,
             settings.stripe_webhook_secret,
         )
@@ -70,4 +108,18 @@ async def get_webhook_signature(request: Request) -> str:
 
 async def get_webhook_payload(request: Request) -> bytes:
     """Get raw request body as bytes for signature verification."""
-    return await request.body()
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_WEBHOOK_PAYLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,  # Payload Too Large
+            detail="Webhook payload too large",
+        )
+
+    payload = await request.body()
+    # Content-Length may be absent (chunked transfer encoding)
+    if len(payload) > MAX_WEBHOOK_PAYLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,  # Payload Too Large
+            detail="Webhook payload too large",
+        )
+    return payload
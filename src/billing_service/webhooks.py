@@ -3,6 +3,7 @@
 import logging
 
 from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 
 from billing_service.webhook_processors import event_router
@@ -54,14 +55,17 @@ async def stripe_webhook(request: Request) -> JSONResponse:
             },
         )
 
-        # Process event (idempotent)
+        # Process event (idempotent). Processors do blocking database and Stripe I/O,
+        # so they run in the threadpool instead of stalling the event loop.
         try:
-            event_router.process_event(event)
+            await run_in_threadpool(event_router.process_event, event)
         except ValueError as e:
             # Permanent error (e.g., invalid data, missing required fields)
             # Mark as processed to prevent retry storms
             logger.error(
-                f"Permanent error processing event {event.id}: {e}",
+                "Permanent error processing event %s: %s",
+                event.id,
+                e,
                 extra={"event_id": event.id, "error": str(e)},
                 exc_info=True,
             )
@@ -76,7 +80,9 @@ async def stripe_webhook(request: Request) -> JSONResponse:
             # Transient error (e.g., database connection, external service)
             # Don't mark as processed - allow Stripe retry
             logger.error(
-                f"Transient error processing event {event.id}: {e}",
+                "Transient error processing event %s: %s",
+                event.id,
+                e,
                 extra={"event_id": event.id, "error": str(e)},
                 exc_info=True,
             )
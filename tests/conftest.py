@@ -1,8 +1,16 @@
 """Test fixtures and utilities."""
 
+import hashlib
+from contextlib import contextmanager
+import os
+import sys
+import uuid
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
 import pytest
 import pytest_asyncio
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, insert
 from sqlalchemy.orm import sessionmaker
 
 from billing_service.database import Base, get_db
@@ -23,10 +31,14 @@ try:
 except ImportError:
     pass
 
+# API key of the shared test project and the digest stored on its row
+_TEST_API_KEY = "test_api_key_123"
+_TEST_API_KEY_HASH = hashlib.sha256(_TEST_API_KEY.encode()).hexdigest()
+
 
-@pytest_asyncio.fixture
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
 async def client():
-    """Create async test client for FastAPI tests."""
+    """Create the async test client shared by all FastAPI tests."""
     import httpx
     from httpx import ASGITransport
     from billing_service.main import app
@@ -34,6 +46,44 @@ async def client():
         yield ac
 
 
+@pytest.fixture(scope="session")
+def sync_client():
+    """Create the synchronous TestClient shared by the webhook tests.
+
+    Not entered as a context manager, so the app lifespan (and its reconciliation
+    scheduler) never starts.
+    """
+    from fastapi.testclient import TestClient
+    from billing_service.main import app
+    return TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def _reset_dependency_overrides():
+    """Clear FastAPI dependency overrides after each test, since the app and client are shared."""
+    yield
+    # Only touch the app if a test imported it; unit tests shouldn't pay for loading it
+    main_module = sys.modules.get("billing_service.main")
+    if main_module is not None:
+        main_module.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def override_dependencies():
+    """Return a context manager that installs FastAPI dependency overrides and clears them on exit."""
+    from billing_service.main import app
+
+    @contextmanager
+    def _override_dependencies(overrides):
+        app.dependency_overrides.update(overrides)
+        try:
+            yield
+        finally:
+            app.dependency_overrides.clear()
+
+    return _override_dependencies
+
+
 # Global test database engine (thread-safe with SQLite)
 _test_engine = None
 _test_session_factory = None
@@ -46,12 +96,14 @@ def db_engine():
     
     if _test_engine is None:
         # Use check_same_thread=False to allow SQLite to work across threads (for AsyncClient tests)
-        # Note: This is safe for tests but should not be used in production
+        # Note: This is safe for tests but should not be used in production.
+        # A named shared-cache in-memory database is visible to every connection in the process,
+        # so sessions opened from any thread see the same data and the schema is created once.
+        # Name the database per pytest-xdist worker ("main" when not distributed)
+        worker_id = os.environ.get("PYTEST_XDIST_WORKER", "main")
         _test_engine = create_engine(
-            "sqlite:///:memory:",
+            f"sqlite+pysqlite:///file:testdb_{worker_id}?mode=memory&cache=shared&uri=true",
             connect_args={"check_same_thread": False},
-            pool_pre_ping=True,
-            poolclass=None,  # Use StaticPool for in-memory SQLite
         )
         Base.metadata.create_all(_test_engine)
         _test_session_factory = sessionmaker(autocommit=False, autoflush=False, bind=_test_engine)
@@ -59,12 +111,56 @@ def db_engine():
     return _test_engine
 
 
+@pytest.fixture(scope="session")
+def db_session_factory(db_engine):
+    """Return the shared session factory bound to the test engine (configured like SessionLocal)."""
+    return _test_session_factory
+
+
+@pytest.fixture(scope="session")
+def get_db_override(db_session_factory):
+    """Return a get_db replacement that opens a new test-engine session per request.
+
+    Built once per session so tests can install it in ``app.dependency_overrides``
+    without defining their own generator each time.
+    """
+    async def _get_test_db():
+        test_session = db_session_factory()
+        try:
+            yield test_session
+        finally:
+            test_session.close()
+
+    return _get_test_db
+
+
+@pytest.fixture
+def count_queries(db_engine):
+    """Return a context manager that collects the SQL statements issued on the test engine."""
+    @contextmanager
+    def _count_queries():
+        statements = []
+
+        def record_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db_engine, "before_cursor_execute", record_statement)
+        try:
+            yield statements
+        finally:
+            event.remove(db_engine, "before_cursor_execute", record_statement)
+
+    return _count_queries
+
+
 @pytest.fixture(scope="function")
 def db_session(db_engine):
     """Create a test database session (function-scoped, thread-safe)."""
     # Create a new session for each test from the shared engine
-    # This ensures thread safety when AsyncClient runs in different threads
-    session = _test_session_factory()
+    # This ensures thread safety when AsyncClient runs in different threads.
+    # Commits don't expire loaded objects, so fixture rows aren't re-SELECTed on next access;
+    # the factory itself keeps SessionLocal's expiry semantics for code under test.
+    session = _test_session_factory(expire_on_commit=False)
     try:
         # Ensure clean state for each test
         yield session
@@ -73,113 +169,99 @@ def db_session(db_engine):
         session.close()
 
 
+@dataclass(frozen=True)
+class _SeedIds:
+    """Primary keys of the shared test project, product and price."""
+
+    project_id: uuid.UUID
+    product_id: uuid.UUID
+    price_id: uuid.UUID
+
+
+@pytest.fixture(scope="session")
+def now_utc():
+    """Return one naive UTC timestamp for the whole session, matching the service's datetime convention."""
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+@pytest.fixture(scope="session")
+def test_api_key():
+    """Return the raw API key whose hash is stored on the shared test project."""
+    return _TEST_API_KEY
+
+
+@pytest.fixture(scope="session")
+def _seed_ids(db_engine):
+    """Insert the shared test project, product and price once per run, in one transaction."""
+    with db_engine.begin() as conn:
+        project_id = conn.execute(
+            insert(Project)
+            .values(
+                project_id="test-project",
+                name="Test Project",
+                description="Test project description",
+                api_key_hash=_TEST_API_KEY_HASH,
+                is_active=True,
+            )
+            .returning(Project.id)
+        ).scalar_one()
+        product_id = conn.execute(
+            insert(Product)
+            .values(
+                product_id="test-product",
+                project_id=project_id,
+                name="Test Product",
+                description="Test product description",
+                feature_codes=["feature1", "feature2"],
+                is_archived=False,
+            )
+            .returning(Product.id)
+        ).scalar_one()
+        price_id = conn.execute(
+            insert(Price)
+            .values(
+                stripe_price_id="price_test123",
+                product_id=product_id,
+                amount=999,  # $9.99
+                currency="usd",
+                interval=PriceInterval.MONTH,
+                is_archived=False,
+            )
+            .returning(Price.id)
+        ).scalar_one()
+    return _SeedIds(project_id=project_id, product_id=product_id, price_id=price_id)
+
+
+def _commit_if_modified(session, instance):
+    """Commit only when a reset actually changed a seeded row; most tests leave them untouched."""
+    if session.is_modified(instance):
+        session.commit()
+
+
 @pytest.fixture
-def test_project(db_engine):
-    """Create a test project."""
-    import hashlib
-    from sqlalchemy.orm import sessionmaker
-    
-    TestingSessionLocal = sessionmaker(bind=db_engine)
-    db_session = TestingSessionLocal()
-    
-    try:
-        api_key = "test_api_key_123"
-        api_key_hash = hashlib.sha256(api_key.encode()).hexdigest()
-
-        # Check if project already exists to avoid UNIQUE constraint violations
-        existing_project = db_session.query(Project).filter(Project.project_id == "test-project").first()
-        if existing_project:
-            # Update existing project
-            existing_project.api_key_hash = api_key_hash
-            existing_project.is_active = True
-            db_session.commit()
-            db_session.refresh(existing_project)
-            return existing_project
-
-        project = Project(
-            project_id="test-project",
-            name="Test Project",
-            description="Test project description",
-            api_key_hash=api_key_hash,
-            is_active=True,
-        )
-        db_session.add(project)
-        db_session.commit()
-        db_session.refresh(project)
-        return project
-    finally:
-        db_session.close()
+def test_project(db_session, _seed_ids):
+    """Return the shared test project, restored to its initial state."""
+    project = db_session.get(Project, _seed_ids.project_id)
+    # Tests may deactivate the project or rotate its key; undo that for the next test
+    project.api_key_hash = _TEST_API_KEY_HASH
+    project.is_active = True
+    _commit_if_modified(db_session, project)
+    return project
 
 
 @pytest.fixture
-def test_product(db_engine, test_project):
-    """Create a test product."""
-    from sqlalchemy.orm import sessionmaker
-    
-    TestingSessionLocal = sessionmaker(bind=db_engine)
-    db_session = TestingSessionLocal()
-    
-    try:
-        # Check if product already exists to avoid UNIQUE constraint violations
-        existing_product = db_session.query(Product).filter(
-            Product.product_id == "test-product",
-            Product.project_id == test_project.id
-        ).first()
-        if existing_product:
-            # Update existing product
-            existing_product.is_archived = False
-            db_session.commit()
-            db_session.refresh(existing_product)
-            return existing_product
-
-        product = Product(
-            product_id="test-product",
-            project_id=test_project.id,
-            name="Test Product",
-            description="Test product description",
-            feature_codes=["feature1", "feature2"],
-            is_archived=False,
-        )
-        db_session.add(product)
-        db_session.commit()
-        db_session.refresh(product)
-        return product
-    finally:
-        db_session.close()
+def test_product(db_session, test_project, _seed_ids):
+    """Return the shared test product, restored to its initial state."""
+    product = db_session.get(Product, _seed_ids.product_id)
+    product.is_archived = False
+    _commit_if_modified(db_session, product)
+    return product
 
 
 @pytest.fixture
-def test_price(db_engine, test_product):
-    """Create a test price."""
-    from sqlalchemy.orm import sessionmaker
-    
-    TestingSessionLocal = sessionmaker(bind=db_engine)
-    db_session = TestingSessionLocal()
-    
-    try:
-        # Check if price already exists to avoid UNIQUE constraint violations
-        existing_price = db_session.query(Price).filter(
-            Price.stripe_price_id == "price_test123",
-            Price.product_id == test_product.id
-        ).first()
-        if existing_price:
-            # Update existing price
-            existing_price.is_archived = False
-            db_session.commit()
-            db_session.refresh(existing_price)
-            return existing_price
-
-        price = Price(
-            stripe_price_id="price_test123",
-            product_id=test_product.id,
-            amount=999,  # $9.99
-            currency="usd",
-            interval=PriceInterval.MONTH,
-            is_archived=False,
-        )
-        db_session.add(price)
-        db_session.commit()
-        db_session.refresh(price)
-        return price
-    finally:
-        db_session.close()
+def test_price(db_session, test_product, _seed_ids):
+    """Return the shared test price, restored to its initial state."""
+    price = db_session.get(Price, _seed_ids.price_id)
+    price.is_archived = False
+    _commit_if_modified(db_session, price)
+    return price
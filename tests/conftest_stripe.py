@@ -1,17 +1,24 @@
 """Fixtures for integration tests with real Stripe API."""
 
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Generator
+
 import pytest
-import stripe
-from typing import Generator
 
 from billing_service.config import settings
 
+# stripe is imported inside the fixtures so unit-only runs never pay for loading the SDK
+if TYPE_CHECKING:
+    import stripe
 
 # Check if we should use real Stripe APIs
 USE_REAL_STRIPE = os.getenv("USE_REAL_STRIPE", "false").lower() in ("true", "1", "yes")
 STRIPE_SECRET_KEY = settings.stripe_secret_key if USE_REAL_STRIPE and settings.stripe_secret_key else None
 
+# Parallel Stripe API calls during end-of-session cleanup
+CLEANUP_MAX_WORKERS = 8
+
 
 @pytest.fixture(scope="session")
 def stripe_api_configured():
@@ -22,31 +29,35 @@ def stripe_api_configured():
     if not STRIPE_SECRET_KEY or not STRIPE_SECRET_KEY.startswith("sk_test_"):
         pytest.skip("Stripe test secret key not configured - skipping real Stripe API tests")
     
+    import stripe
+
     stripe.api_key = STRIPE_SECRET_KEY
     return True
 
 
-@pytest.fixture
-def stripe_product(stripe_api_configured) -> Generator[stripe.Product, None, None]:
-    """Create a real Stripe product for testing."""
+@pytest.fixture(scope="session")
+def stripe_product(stripe_api_configured) -> Generator["stripe.Product", None, None]:
+    """Create a real Stripe product for testing, shared by the whole session."""
+    import stripe
+
     product = stripe.Product.create(
         name="Test Product",
         description="Test product for integration tests",
         metadata={"test": "true"},
     )
     
+    # Archived by cleanup_stripe_test_data() at session end
     yield product
-    
-    # Cleanup: archive the product (can't delete products with prices)
-    try:
-        stripe.Product.modify(product.id, active=False)
-    except Exception:
-        pass
 
 
 @pytest.fixture
-def stripe_price(stripe_product) -> Generator[stripe.Price, None, None]:
-    """Create a real Stripe price for testing."""
+def stripe_price(stripe_product) -> Generator["stripe.Price", None, None]:
+    """Create a real Stripe price for testing.
+
+    Function-scoped: tests insert a local Price row keyed on the (unique) Stripe price ID.
+    """
+    import stripe
+
     price = stripe.Price.create(
         currency="usd",
         unit_amount=999,  # $9.99
@@ -55,30 +66,22 @@ def stripe_price(stripe_product) -> Generator[stripe.Price, None, None]:
         metadata={"test": "true"},
     )
     
+    # Archived by cleanup_stripe_test_data() at session end
     yield price
-    
-    # Cleanup: archive the price
-    try:
-        stripe.Price.modify(price.id, active=False)
-    except Exception:
-        pass
 
 
-@pytest.fixture
-def stripe_customer(stripe_api_configured) -> Generator[stripe.Customer, None, None]:
-    """Create a real Stripe customer for testing."""
+@pytest.fixture(scope="session")
+def stripe_customer(stripe_api_configured) -> Generator["stripe.Customer", None, None]:
+    """Create a real Stripe customer for testing, shared by the whole session."""
+    import stripe
+
     customer = stripe.Customer.create(
         email="test@example.com",
         metadata={"test": "true"},
     )
     
+    # Deleted (along with attached payment methods) by cleanup_stripe_test_data() at session end
     yield customer
-    
-    # Cleanup: delete the customer
-    try:
-        stripe.Customer.delete(customer.id)
-    except Exception:
-        pass
 
 
 @pytest.fixture
@@ -94,7 +97,7 @@ def stripe_test_card():
 
 
 @pytest.fixture
-def stripe_payment_method(stripe_customer, stripe_api_configured) -> Generator[stripe.PaymentMethod, None, None]:
+def stripe_payment_method(stripe_customer, stripe_api_configured) -> Generator["stripe.PaymentMethod", None, None]:
     """Create a real Stripe payment method for testing.
     
     NOTE: This fixture requires "Test mode card data" to be enabled in your Stripe Dashboard
@@ -108,6 +111,8 @@ def stripe_payment_method(stripe_customer, stripe_api_configured) -> Generator[s
     
     See: https://support.stripe.com/questions/enabling-access-to-raw-card-data-apis
     """
+    import stripe
+
     try:
         # In Stripe test mode with "Test mode card data" enabled, you can use test card numbers
         # These are Stripe's official test card numbers that work in test mode
@@ -137,18 +142,13 @@ def stripe_payment_method(stripe_customer, stripe_api_configured) -> Generator[s
                 "See: https://support.stripe.com/questions/enabling-access-to-raw-card-data-apis"
             )
         raise
-    finally:
-        # Cleanup: detach and delete payment method
-        try:
-            if 'payment_method' in locals():
-                stripe.PaymentMethod.detach(payment_method.id)
-        except Exception:
-            pass
 
 
 @pytest.fixture
-def stripe_checkout_session(stripe_price, stripe_api_configured) -> Generator[stripe.checkout.Session, None, None]:
+def stripe_checkout_session(stripe_price, stripe_api_configured) -> Generator["stripe.checkout.Session", None, None]:
     """Create a real Stripe checkout session for testing."""
+    import stripe
+
     session = stripe.checkout.Session.create(
         payment_method_types=["card"],
         line_items=[{"price": stripe_price.id, "quantity": 1}],
@@ -163,38 +163,61 @@ def stripe_checkout_session(stripe_price, stripe_api_configured) -> Generator[st
     # Checkout sessions can't be deleted, but they expire naturally
 
 
+def _ignore_errors(call: Callable[..., object], *args: object, **kwargs: object) -> None:
+    """Run a best-effort cleanup call, ignoring Stripe/network failures."""
+    try:
+        call(*args, **kwargs)
+    except Exception:
+        pass
+
+
+def _active_prices(product: "stripe.Product") -> "list[stripe.Price]":
+    """List a product's active prices, or nothing if the listing fails."""
+    import stripe
+
+    try:
+        return list(stripe.Price.list(product=product.id, active=True, limit=100).auto_paging_iter())
+    except Exception:
+        return []
+
+
 def cleanup_stripe_test_data():
-    """Cleanup function to remove all test data from Stripe."""
+    """Cleanup function to remove all test data from Stripe.
+
+    Collects every test-tagged object first, then archives/deletes them in parallel;
+    stripe-python is thread-safe and each call is an independent HTTPS round trip.
+    """
     if not STRIPE_SECRET_KEY:
         return
     
+    import stripe
+
     stripe.api_key = STRIPE_SECRET_KEY
     
-    # List and archive/delete test products
-    try:
-        products = stripe.Product.list(limit=100, active=True)
-        for product in products.data:
-            if product.metadata.get("test") == "true":
-                try:
-                    # Archive associated prices first
-                    prices = stripe.Price.list(product=product.id, limit=100)
-                    for price in prices.data:
-                        stripe.Price.modify(price.id, active=False)
-                    stripe.Product.modify(product.id, active=False)
-                except Exception:
-                    pass
-    except Exception:
-        pass
-    
-    # List and delete test customers
     try:
-        customers = stripe.Customer.list(limit=100)
-        for customer in customers.data:
-            if customer.metadata.get("test") == "true":
-                try:
-                    stripe.Customer.delete(customer.id)
-                except Exception:
-                    pass
+        products = [
+            product
+            for product in stripe.Product.list(limit=100, active=True).auto_paging_iter()
+            if product.metadata.get("test") == "true"
+        ]
+        customers = [
+            customer
+            for customer in stripe.Customer.list(limit=100).auto_paging_iter()
+            if customer.metadata.get("test") == "true"
+        ]
     except Exception:
-        pass
+        return
+
+    with ThreadPoolExecutor(max_workers=CLEANUP_MAX_WORKERS) as executor:
+        price_pages = executor.map(_active_prices, products)
+        prices = [price for page in price_pages for price in page]
+
+        # Archive prices before their products; deleting a customer detaches its payment methods
+        list(executor.map(lambda price: _ignore_errors(stripe.Price.modify, price.id, active=False), prices))
+        list(executor.map(lambda customer: _ignore_errors(stripe.Customer.delete, customer.id), customers))
+        list(executor.map(lambda product: _ignore_errors(stripe.Product.modify, product.id, active=False), products))
+
 
+def pytest_sessionfinish(session, exitstatus):
+    """Remove all Stripe test data once, after the whole run."""
+    cleanup_stripe_test_data()
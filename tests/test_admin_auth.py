@@ -1,35 +1,31 @@
 """Tests for admin API authentication."""
 
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import Mock
 from fastapi import HTTPException
 from fastapi.security import HTTPAuthorizationCredentials
 
 from billing_service.auth import verify_admin_api_key, hash_api_key
+from billing_service.config import settings
 
 
 @pytest.mark.asyncio
-@patch("billing_service.config.settings")
-async def test_verify_admin_api_key_success(mock_settings):
+async def test_verify_admin_api_key_success(monkeypatch):
     """Test successful admin API key verification."""
-    # Create a mock settings object with admin_api_key attribute
-    mock_settings.admin_api_key = "admin_key_123"
+    monkeypatch.setattr(settings, "admin_api_key", "admin_key_123")
     
     mock_credentials = Mock(spec=HTTPAuthorizationCredentials)
     mock_credentials.credentials = "admin_key_123"
     
-    # Import after patching to ensure the patch is in place
-    from billing_service.auth import verify_admin_api_key
     result = await verify_admin_api_key(mock_credentials)
     # admin_key_123[:8] = "admin_ke", so result should be "admin_ke..."
     assert result == "admin_ke..."
 
 
 @pytest.mark.asyncio
-@patch("billing_service.config.settings")
-async def test_verify_admin_api_key_invalid(mock_settings):
+async def test_verify_admin_api_key_invalid(monkeypatch):
     """Test admin API key verification with invalid key."""
-    mock_settings.admin_api_key = "admin_key_123"
+    monkeypatch.setattr(settings, "admin_api_key", "admin_key_123")
     
     mock_credentials = Mock(spec=HTTPAuthorizationCredentials)
     mock_credentials.credentials = "wrong_key"
@@ -40,10 +36,9 @@ async def test_verify_admin_api_key_invalid(mock_settings):
 
 
 @pytest.mark.asyncio
-@patch("billing_service.config.settings")
-async def test_verify_admin_api_key_not_configured(mock_settings):
+async def test_verify_admin_api_key_not_configured(monkeypatch):
     """Test admin API key verification when not configured."""
-    mock_settings.admin_api_key = None
+    monkeypatch.setattr(settings, "admin_api_key", None)
     
     mock_credentials = Mock(spec=HTTPAuthorizationCredentials)
     mock_credentials.credentials = "any_key"
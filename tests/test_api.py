@@ -1,19 +1,15 @@
 """Tests for API endpoints."""
 
-from datetime import datetime
 import pytest
 import httpx
 from unittest.mock import Mock, patch
 
+import billing_service.prometheus_metrics as prometheus_metrics
+from billing_service.auth import verify_project_api_key
+from billing_service.database import get_db
 from billing_service.main import app
-from billing_service.models import Entitlement, EntitlementSource, Project
-
-
-@pytest.fixture
-def mock_db_session(db_session):
-    """Mock database session."""
-    with patch("billing_service.entitlements_api.get_db", return_value=db_session):
-        yield db_session
+from billing_service.models import Entitlement, EntitlementSource
+from billing_service.prometheus_metrics import entitlements_cache_total
 
 
 @pytest.mark.asyncio
@@ -36,58 +32,24 @@ async def test_ready_endpoint(client):
 
 @patch("billing_service.checkout_api.create_checkout_session")
 @pytest.mark.asyncio
-async def test_create_checkout_endpoint(mock_create_session, client, db_engine, test_project, test_price):
+async def test_create_checkout_endpoint(
+    mock_create_session, client, test_project, test_api_key, test_price, get_db_override, override_dependencies
+):
     """Test checkout creation endpoint."""
-    import hashlib
-    from billing_service.main import app
-    from billing_service.database import get_db
-    from billing_service.auth import verify_project_api_key
-    
-    # Update test project - need to refresh it in the same session we'll use for overrides
-    # Create sessionmaker once to use for both setup and override
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
-    
-    # Get fresh project from engine to avoid thread issues
-    test_db = TestingSessionLocal()
-    try:
-        api_key = "test_checkout_key"
-        api_key_hash = hashlib.sha256(api_key.encode()).hexdigest()
-        # Query project from DB using engine to get fresh object
-        fresh_project = test_db.query(Project).filter(Project.id == test_project.id).first()
-        fresh_project.api_key_hash = api_key_hash
-        test_db.commit()
-        test_db.refresh(fresh_project)
-        # Use fresh_project in overrides
-        test_project_for_override = fresh_project
-    finally:
-        test_db.close()
-    
-    # Use FastAPI dependency override - create a new session per request for thread safety
-    # Use db_engine directly, not db_session.bind, to avoid thread issues
-    async def override_get_db():
-        test_session = TestingSessionLocal()
-        try:
-            yield test_session
-        finally:
-            test_session.close()
     
     async def override_verify():
         return test_project
     
-    app.dependency_overrides[get_db] = override_get_db
-    app.dependency_overrides[verify_project_api_key] = override_verify
-    
     mock_session = Mock()
     mock_session.url = "https://checkout.stripe.com/test"
     mock_session.id = "cs_test123"
     mock_session.expires_at = 1234567890
     mock_create_session.return_value = mock_session
     
-    try:
+    with override_dependencies({get_db: get_db_override, verify_project_api_key: override_verify}):
         response = await client.post(
             "/api/v1/checkout/create",
-            headers={"Authorization": f"Bearer {api_key}"},
+            headers={"Authorization": f"Bearer {test_api_key}"},
             json={
                 "user_id": "user_123",
                 "project_id": "test-project",
@@ -97,80 +59,99 @@ async def test_create_checkout_endpoint(mock_create_session, client, db_engine,
                 "cancel_url": "https://example.com/cancel",
             },
         )
-        
-        # Should succeed with proper mocking
-        assert response.status_code == 200
-        data = response.json()
-        assert "checkout_url" in data
-    finally:
-        app.dependency_overrides.clear()
+
+    # Should succeed with proper mocking
+    assert response.status_code == 200
+    data = response.json()
+    assert "checkout_url" in data
 
 
 @pytest.mark.asyncio
-async def test_get_entitlements_endpoint(client, db_engine, test_project):
+async def test_get_entitlements_endpoint(
+    client, db_session, test_project, test_api_key, get_db_override, override_dependencies, now_utc
+):
     """Test entitlements query endpoint."""
-    import hashlib
-    from billing_service.main import app
-    from billing_service.database import get_db
-    from billing_service.auth import verify_project_api_key
     
-    # Set up test data in a session from the engine
-    from sqlalchemy.orm import sessionmaker
-    from billing_service.models import Project
-    TestingSessionLocal = sessionmaker(bind=db_engine)
-    test_db = TestingSessionLocal()
-    try:
-        api_key = "test_entitlements_key"
-        api_key_hash = hashlib.sha256(api_key.encode()).hexdigest()
-        # Query project from DB using engine to get fresh object
-        fresh_project = test_db.query(Project).filter(Project.id == test_project.id).first()
-        fresh_project.api_key_hash = api_key_hash
-        test_db.commit()
-        
-        # Create entitlement
-        entitlement = Entitlement(
+    # Set up test data
+    db_session.add(
+        Entitlement(
             user_id="user_123",
-            project_id=fresh_project.id,
+            project_id=test_project.id,
             feature_code="feature1",
             is_active=True,
-            valid_from=datetime.utcnow(),
+            valid_from=now_utc,
             valid_to=None,
             source=EntitlementSource.SUBSCRIPTION,
-            source_id=fresh_project.id,  # Using project ID as placeholder
+            source_id=test_project.id,  # Using project ID as placeholder
         )
-        test_db.add(entitlement)
-        test_db.commit()
-        test_db.refresh(fresh_project)
-        # Use fresh_project in overrides
-        test_project_for_override = fresh_project
-    finally:
-        test_db.close()
-    
-    # Use FastAPI dependency override - create a new session per request for thread safety
-    # Use db_engine directly to avoid thread issues
-    async def override_get_db():
-        test_session = TestingSessionLocal()
-        try:
-            yield test_session
-        finally:
-            test_session.close()
+    )
+    db_session.commit()
     
     async def override_verify():
-        return test_project_for_override
+        return test_project
     
-    app.dependency_overrides[get_db] = override_get_db
+    with override_dependencies({get_db: get_db_override, verify_project_api_key: override_verify}):
+        response = await client.get(
+            "/api/v1/entitlements?user_id=user_123",
+            headers={"Authorization": f"Bearer {test_api_key}"},
+        )
+
+    # Should succeed with proper mocking
+    assert response.status_code == 200
+    data = response.json()
+    assert data["user_id"] == "user_123"
+    assert len(data["entitlements"]) >= 1
+
+
+@pytest.mark.asyncio
+@patch("billing_service.entitlements_api.get_cached_entitlements")
+async def test_get_entitlements_cache_hit_metric(mock_get_cached, client, test_project, now_utc):
+    """Test cached entitlements are counted under result="hit"."""
+
+    mock_get_cached.return_value = [
+        {
+            "feature_code": "feature1",
+            "is_active": True,
+            "valid_from": now_utc.isoformat(),
+            "valid_to": None,
+            "source": "subscription",
+        }
+    ]
+    hits = entitlements_cache_total.labels(result="hit")
+    before = hits._value.get()
+
+    async def override_verify():
+        return test_project
+
     app.dependency_overrides[verify_project_api_key] = override_verify
-    
+
     try:
         response = await client.get(
             "/api/v1/entitlements?user_id=user_123",
-            headers={"Authorization": f"Bearer {api_key}"},
+            headers={"Authorization": "Bearer test_key"},
         )
-        
-        # Should succeed with proper mocking
+
         assert response.status_code == 200
-        data = response.json()
-        assert data["user_id"] == "user_123"
-        assert len(data["entitlements"]) >= 1
+        assert response.json()["entitlements"][0]["feature_code"] == "feature1"
+        assert hits._value.get() == before + 1
     finally:
         app.dependency_overrides.clear()
+
+
+@pytest.mark.asyncio
+@patch("billing_service.prometheus_metrics.generate_latest")
+async def test_metrics_endpoint_reuses_encoded_payload(mock_generate, client):
+    """Test scrapes inside the cache window share one encoded payload."""
+
+    mock_generate.return_value = b"# metrics\n"
+    prometheus_metrics._metrics_generated_at = float("-inf")
+
+    try:
+        first = await client.get("/metrics")
+        second = await client.get("/metrics")
+
+        assert first.status_code == 200
+        assert first.content == second.content == b"# metrics\n"
+        mock_generate.assert_called_once()
+    finally:
+        prometheus_metrics._metrics_generated_at = float("-inf")
@@ -1,10 +1,17 @@
 """Tests for authentication."""
 
 import hashlib
+import inspect
 
 import pytest
 
-from billing_service.auth import hash_api_key, verify_api_key, get_project_from_api_key
+from billing_service.auth import (
+    hash_api_key,
+    verify_api_key,
+    get_project_from_api_key,
+    verify_admin_api_key,
+    verify_project_api_key,
+)
 from billing_service.models import Project
 
 
@@ -30,6 +37,12 @@ def test_verify_api_key():
     assert verify_api_key(hashed, "wrong_key") is False
 
 
+def test_auth_dependencies_are_coroutines():
+    """Test auth dependencies are async so FastAPI awaits them instead of dispatching to its threadpool."""
+    assert inspect.iscoroutinefunction(verify_project_api_key)
+    assert inspect.iscoroutinefunction(verify_admin_api_key)
+
+
 @pytest.mark.asyncio
 async def test_get_project_from_api_key(db_session):
     """Test retrieving project from API key."""
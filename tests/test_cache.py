@@ -1,88 +1,141 @@
 """Tests for cache functionality."""
 
+import orjson
 import pytest
 from unittest.mock import Mock, patch
+from redis.exceptions import RedisError
 
 from billing_service.cache import (
+    EVENT_CLAIM_TTL_SECONDS,
     get_redis_client,
     is_event_processed,
     mark_event_processed,
+    check_and_claim_event,
+    release_event_claim,
     cache_entitlements,
     get_cached_entitlements,
     invalidate_entitlements_cache,
+    invalidate_entitlements_caches,
 )
 
 
-@patch("billing_service.cache.get_redis_client")
-def test_is_event_processed(mock_get_client):
+@pytest.fixture
+def mock_redis_client(monkeypatch):
+    """Point get_redis_client at a mock Redis client for the duration of the test."""
+    client = Mock()
+    monkeypatch.setattr("billing_service.cache.get_redis_client", lambda: client)
+    return client
+
+
+def test_is_event_processed(mock_redis_client):
     """Test checking if event is processed."""
-    mock_client = Mock()
-    mock_get_client.return_value = mock_client
-    
     # Event not processed
-    mock_client.exists.return_value = False
+    mock_redis_client.exists.return_value = False
     assert is_event_processed("evt_123") is False
     
     # Event processed
-    mock_client.exists.return_value = True
+    mock_redis_client.exists.return_value = True
     assert is_event_processed("evt_123") is True
 
 
-@patch("billing_service.cache.get_redis_client")
-def test_mark_event_processed(mock_get_client):
+def test_mark_event_processed(mock_redis_client):
     """Test marking event as processed."""
-    mock_client = Mock()
-    mock_get_client.return_value = mock_client
-    
     mark_event_processed("evt_456")
     
-    mock_client.setex.assert_called_once()
-    args = mock_client.setex.call_args[0]
+    mock_redis_client.setex.assert_called_once()
+    args = mock_redis_client.setex.call_args[0]
     assert args[0] == "webhook_event:evt_456"
 
 
+def test_check_and_claim_event(mock_redis_client):
+    """Test claiming an event with SET NX."""
+    # First delivery claims the event
+    mock_redis_client.set.return_value = True
+    assert check_and_claim_event("evt_789") is True
+    args, kwargs = mock_redis_client.set.call_args
+    assert args[0] == "webhook_event:evt_789"
+    assert kwargs["nx"] is True
+    # Claimed for the short processing window, not the 48h processed TTL
+    assert kwargs["ex"] == EVENT_CLAIM_TTL_SECONDS
+    
+    # Duplicate delivery loses the claim
+    mock_redis_client.set.return_value = None
+    assert check_and_claim_event("evt_789") is False
+
+
 @patch("billing_service.cache.get_redis_client")
-def test_cache_entitlements(mock_get_client):
-    """Test caching entitlements."""
-    mock_client = Mock()
-    mock_get_client.return_value = mock_client
+def test_check_and_claim_event_redis_error(mock_get_client):
+    """Test claiming an event fails open when Redis is unavailable."""
+    mock_get_client.side_effect = RedisError("Connection refused")
+    
+    assert check_and_claim_event("evt_789") is True
+
+
+def test_release_event_claim(mock_redis_client):
+    """Test releasing an event claim."""
+    release_event_claim("evt_789")
     
+    mock_redis_client.delete.assert_called_once_with("webhook_event:evt_789")
+
+
+def test_cache_entitlements(mock_redis_client):
+    """Test caching entitlements."""
     entitlements = [{"feature_code": "feature1", "is_active": True}]
     cache_entitlements("user_123", "project_456", entitlements)
     
-    mock_client.setex.assert_called_once()
-    args = mock_client.setex.call_args[0]
+    mock_redis_client.setex.assert_called_once()
+    args = mock_redis_client.setex.call_args[0]
     assert "entitlements:project_456:user_123" in args[0]
 
 
-@patch("billing_service.cache.get_redis_client")
-def test_get_cached_entitlements(mock_get_client):
-    """Test retrieving cached entitlements."""
-    mock_client = Mock()
-    mock_get_client.return_value = mock_client
+@pytest.mark.parametrize(
+    "cached_value,error,expected",
+    [
+        pytest.param(orjson.dumps([{"feature_code": "feature1"}]), None, [{"feature_code": "feature1"}], id="hit"),
+        pytest.param(None, None, None, id="miss"),
+        pytest.param(b"\xff{not json", None, None, id="corrupt_value"),
+        pytest.param(None, RedisError("Connection refused"), None, id="redis_error"),
+    ],
+)
+def test_get_cached_entitlements(mock_redis_client, cached_value, error, expected):
+    """Test retrieving cached entitlements; misses, undecodable values and Redis errors all return None."""
+    mock_redis_client.get.return_value = cached_value
+    mock_redis_client.get.side_effect = error
     
-    # Cache hit
-    import json
-    cached_data = json.dumps([{"feature_code": "feature1"}])
-    mock_client.get.return_value = cached_data.encode()
+    assert get_cached_entitlements("user_123", "project_456") == expected
+    mock_redis_client.get.assert_called_once_with("entitlements:project_456:user_123")
+
+
+def test_get_cached_entitlements_decodes_with_orjson(mock_redis_client):
+    """Test cache hits are parsed straight from Redis bytes by orjson."""
+    cached_data = orjson.dumps([{"feature_code": "feature1"}])
+    mock_redis_client.get.return_value = cached_data
     
-    result = get_cached_entitlements("user_123", "project_456")
-    assert result == [{"feature_code": "feature1"}]
+    with patch("billing_service.cache.orjson.loads", wraps=orjson.loads) as mock_loads:
+        assert get_cached_entitlements("user_123", "project_456") == [{"feature_code": "feature1"}]
     
-    # Cache miss
-    mock_client.get.return_value = None
-    result = get_cached_entitlements("user_123", "project_456")
-    assert result is None
+    mock_loads.assert_called_once_with(cached_data)
 
 
-@patch("billing_service.cache.get_redis_client")
-def test_invalidate_entitlements_cache(mock_get_client):
+def test_invalidate_entitlements_cache(mock_redis_client):
     """Test invalidating entitlements cache."""
-    mock_client = Mock()
-    mock_get_client.return_value = mock_client
-    
     invalidate_entitlements_cache("user_123", "project_456")
     
-    mock_client.delete.assert_called_once()
-    args = mock_client.delete.call_args[0]
+    mock_redis_client.unlink.assert_called_once()
+    args = mock_redis_client.unlink.call_args[0]
     assert "entitlements:project_456:user_123" in args[0]
+
+
+def test_invalidate_entitlements_caches(mock_redis_client):
+    """Test invalidating several entitlements cache entries with one UNLINK."""
+    invalidate_entitlements_caches([("user_1", "project_456"), ("user_2", "project_456")])
+    
+    mock_redis_client.unlink.assert_called_once_with(
+        "entitlements:project_456:user_1",
+        "entitlements:project_456:user_2",
+    )
+    
+    # Nothing to invalidate - no Redis call
+    mock_redis_client.reset_mock()
+    invalidate_entitlements_caches([])
+    mock_redis_client.unlink.assert_not_called()
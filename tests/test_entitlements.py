@@ -1,9 +1,10 @@
 """Tests for entitlements computation logic."""
 
-from datetime import datetime, timedelta
-import uuid
+from datetime import timedelta
+import itertools
 
 import pytest
+from sqlalchemy import insert
 
 from billing_service.entitlements import compute_entitlements_for_user, recompute_and_store_entitlements
 from billing_service.models import (
@@ -16,191 +17,148 @@ from billing_service.models import (
     SubscriptionStatus,
 )
 
+# Process-unique suffixes for rows that are committed; each xdist worker has its own database
+_id_counter = itertools.count()
 
-def test_compute_entitlements_from_subscription(db_session, test_project, test_product, test_price):
-    """Test computing entitlements from an active subscription."""
-    # Use unique IDs to ensure test isolation
-    unique_user_id = f"user_{uuid.uuid4().hex[:24]}"
-    unique_sub_id = f"sub_{uuid.uuid4().hex[:24]}"
 
-    # Clean up any existing entitlements for this user/project combination
-    db_session.query(Entitlement).filter(
-        Entitlement.user_id == unique_user_id,
-        Entitlement.project_id == test_project.id,
-    ).delete(synchronize_session=False)
-    db_session.commit()
-
-    # Create subscription
-    subscription = Subscription(
-        stripe_subscription_id=unique_sub_id,
-        user_id=unique_user_id,
-        project_id=test_project.id,
-        price_id=test_price.id,
-        status=SubscriptionStatus.ACTIVE,
-        current_period_start=datetime.utcnow(),
-        current_period_end=datetime.utcnow() + timedelta(days=30),
+def _subscription(user_id, project_id, price_id, now, status=SubscriptionStatus.ACTIVE):
+    return Subscription(
+        stripe_subscription_id=f"sub_{user_id}",
+        user_id=user_id,
+        project_id=project_id,
+        price_id=price_id,
+        status=status,
+        current_period_start=now,
+        current_period_end=now + timedelta(days=30),
         cancel_at_period_end=False,
     )
-    db_session.add(subscription)
-    db_session.commit()
-
-    # Compute entitlements
-    entitlements = compute_entitlements_for_user(db_session, unique_user_id, test_project.id)
-
-    # Verify entitlements
-    assert len(entitlements) == 2  # Two features
-    assert all(e.user_id == unique_user_id for e in entitlements)
-    assert all(e.project_id == test_project.id for e in entitlements)
-    assert all(e.source == EntitlementSource.SUBSCRIPTION for e in entitlements)
-    assert all(e.is_active is True for e in entitlements)
-    assert {e.feature_code for e in entitlements} == {"feature1", "feature2"}
-
 
-def test_compute_entitlements_from_purchase(db_session, test_project, test_product, test_price):
-    """Test computing entitlements from a succeeded purchase."""
-    user_id = "user_456"
 
-    # Create purchase
-    purchase = Purchase(
-        stripe_charge_id="ch_test123",
+def _purchase(user_id, project_id, price_id, now, status=PurchaseStatus.SUCCEEDED):
+    return Purchase(
+        stripe_charge_id=f"ch_{user_id}",
         user_id=user_id,
-        project_id=test_project.id,
-        price_id=test_price.id,
+        project_id=project_id,
+        price_id=price_id,
         amount=999,
         currency="usd",
-        status=PurchaseStatus.SUCCEEDED,
-        valid_from=datetime.utcnow(),
+        status=status,
+        valid_from=now,
         valid_to=None,  # Lifetime
     )
-    db_session.add(purchase)
-    db_session.commit()
-
-    # Compute entitlements
-    entitlements = compute_entitlements_for_user(db_session, user_id, test_project.id)
-
-    # Verify entitlements
-    assert len(entitlements) == 2
-    assert all(e.source == EntitlementSource.PURCHASE for e in entitlements)
-    assert all(e.valid_to is None for e in entitlements)  # Lifetime
-
-
-def test_compute_entitlements_from_manual_grant(db_session, test_project):
-    """Test computing entitlements from a manual grant."""
-    user_id = "user_789"
-
-    # Create manual grant
-    grant = ManualGrant(
-        user_id=user_id,
-        project_id=test_project.id,
-        feature_code="feature1",
-        valid_from=datetime.utcnow(),
-        valid_to=datetime.utcnow() + timedelta(days=7),
-        reason="Test grant",
-        granted_by="admin@test.com",
-    )
-    db_session.add(grant)
-    db_session.commit()
-
-    # Compute entitlements
-    entitlements = compute_entitlements_for_user(db_session, user_id, test_project.id)
-
-    # Verify entitlements
-    assert len(entitlements) == 1
-    assert entitlements[0].source == EntitlementSource.MANUAL
-    assert entitlements[0].feature_code == "feature1"
-
 
-def test_compute_entitlements_combines_sources(db_session, test_project, test_product, test_price):
-    """Test that entitlements from multiple sources are combined."""
-    user_id = "user_combined"
 
-    # Create subscription
-    subscription = Subscription(
-        stripe_subscription_id="sub_combined",
+def _manual_grant(user_id, project_id, now, feature_code):
+    return ManualGrant(
         user_id=user_id,
-        project_id=test_project.id,
-        price_id=test_price.id,
-        status=SubscriptionStatus.ACTIVE,
-        current_period_start=datetime.utcnow(),
-        current_period_end=datetime.utcnow() + timedelta(days=30),
-        cancel_at_period_end=False,
-    )
-    db_session.add(subscription)
-
-    # Create manual grant for different feature
-    grant = ManualGrant(
-        user_id=user_id,
-        project_id=test_project.id,
-        feature_code="feature3",
-        valid_from=datetime.utcnow(),
-        valid_to=datetime.utcnow() + timedelta(days=7),
+        project_id=project_id,
+        feature_code=feature_code,
+        valid_from=now,
+        valid_to=now + timedelta(days=7),
         reason="Test grant",
         granted_by="admin@test.com",
     )
-    db_session.add(grant)
-    db_session.commit()
-
-    # Compute entitlements
-    entitlements = compute_entitlements_for_user(db_session, user_id, test_project.id)
-
-    # Should have 3 entitlements: 2 from subscription, 1 from grant
-    assert len(entitlements) == 3
-    assert len([e for e in entitlements if e.source == EntitlementSource.SUBSCRIPTION]) == 2
-    assert len([e for e in entitlements if e.source == EntitlementSource.MANUAL]) == 1
 
 
-def test_compute_entitlements_excludes_canceled_subscription(db_session, test_project, test_product, test_price):
-    """Test that canceled subscriptions don't grant entitlements."""
-    user_id = "user_canceled"
+@pytest.mark.parametrize(
+    "build_rows,expected",
+    [
+        pytest.param(
+            lambda user_id, project_id, price_id, now: [_subscription(user_id, project_id, price_id, now)],
+            {(EntitlementSource.SUBSCRIPTION, "feature1"), (EntitlementSource.SUBSCRIPTION, "feature2")},
+            id="subscription",
+        ),
+        pytest.param(
+            lambda user_id, project_id, price_id, now: [_purchase(user_id, project_id, price_id, now)],
+            {(EntitlementSource.PURCHASE, "feature1"), (EntitlementSource.PURCHASE, "feature2")},
+            id="purchase",
+        ),
+        pytest.param(
+            lambda user_id, project_id, price_id, now: [_manual_grant(user_id, project_id, now, "feature1")],
+            {(EntitlementSource.MANUAL, "feature1")},
+            id="manual_grant",
+        ),
+        pytest.param(
+            lambda user_id, project_id, price_id, now: [
+                _subscription(user_id, project_id, price_id, now),
+                _manual_grant(user_id, project_id, now, "feature3"),
+            ],
+            {
+                (EntitlementSource.SUBSCRIPTION, "feature1"),
+                (EntitlementSource.SUBSCRIPTION, "feature2"),
+                (EntitlementSource.MANUAL, "feature3"),
+            },
+            id="combined_sources",
+        ),
+        pytest.param(
+            lambda user_id, project_id, price_id, now: [
+                _subscription(user_id, project_id, price_id, now, status=SubscriptionStatus.CANCELED)
+            ],
+            set(),
+            id="canceled_subscription",
+        ),
+        pytest.param(
+            lambda user_id, project_id, price_id, now: [
+                _purchase(user_id, project_id, price_id, now, status=PurchaseStatus.REFUNDED)
+            ],
+            set(),
+            id="refunded_purchase",
+        ),
+    ],
+)
+def test_compute_entitlements(db_session, test_project, test_product, test_price, now_utc, build_rows, expected):
+    """Test entitlements computed from subscriptions, purchases and manual grants."""
+    user_id = "user_compute"
 
-    # Create canceled subscription
-    subscription = Subscription(
-        stripe_subscription_id="sub_canceled",
-        user_id=user_id,
-        project_id=test_project.id,
-        price_id=test_price.id,
-        status=SubscriptionStatus.CANCELED,
-        current_period_start=datetime.utcnow(),
-        current_period_end=datetime.utcnow() + timedelta(days=30),
-        cancel_at_period_end=False,
-    )
-    db_session.add(subscription)
-    db_session.commit()
+    # Flush without committing; the db_session fixture rolls these rows back at teardown
+    db_session.add_all(build_rows(user_id, test_project.id, test_price.id, now_utc))
+    db_session.flush()
 
-    # Compute entitlements
     entitlements = compute_entitlements_for_user(db_session, user_id, test_project.id)
 
-    # Should have no entitlements
-    assert len(entitlements) == 0
-
-
-def test_compute_entitlements_excludes_refunded_purchase(db_session, test_project, test_product, test_price):
-    """Test that refunded purchases don't grant entitlements."""
-    user_id = "user_refunded"
-
-    # Create refunded purchase
-    purchase = Purchase(
-        stripe_charge_id="ch_refunded",
-        user_id=user_id,
-        project_id=test_project.id,
-        price_id=test_price.id,
-        amount=999,
-        currency="usd",
-        status=PurchaseStatus.REFUNDED,
-        valid_from=datetime.utcnow(),
-        valid_to=None,
+    assert len(entitlements) == len(expected)
+    assert {(e.source, e.feature_code) for e in entitlements} == expected
+    assert all(e.user_id == user_id and e.project_id == test_project.id for e in entitlements)
+    assert all(e.is_active is True for e in entitlements)
+    # Purchases are lifetime here, so their entitlements never expire
+    assert all(e.valid_to is None for e in entitlements if e.source == EntitlementSource.PURCHASE)
+
+
+def test_compute_entitlements_loads_products_without_extra_queries(
+    db_session, test_project, test_product, test_price, count_queries, now_utc
+):
+    """Test subscription/purchase prices and products are loaded by the joined queries."""
+    unique_user_id = f"user_{next(_id_counter):024d}"
+    # Core executemany insert: the test only reads these rows back through compute_entitlements_for_user
+    db_session.execute(
+        insert(Subscription),
+        [
+            {
+                "stripe_subscription_id": f"sub_{next(_id_counter):024d}",
+                "user_id": unique_user_id,
+                "project_id": test_project.id,
+                "price_id": test_price.id,
+                "status": SubscriptionStatus.ACTIVE,
+                "current_period_start": now_utc,
+                "current_period_end": now_utc + timedelta(days=30),
+                "cancel_at_period_end": False,
+            }
+            for _ in range(2)
+        ],
     )
-    db_session.add(purchase)
     db_session.commit()
+    project_id = test_project.id
+    db_session.expire_all()
 
-    # Compute entitlements
-    entitlements = compute_entitlements_for_user(db_session, user_id, test_project.id)
+    with count_queries() as statements:
+        entitlements = compute_entitlements_for_user(db_session, unique_user_id, project_id)
 
-    # Should have no entitlements
-    assert len(entitlements) == 0
+    assert len(entitlements) == 4  # Two subscriptions x two features
+    # One query each for subscriptions, purchases and manual grants
+    assert len(statements) == 3
 
 
-def test_recompute_and_store_entitlements(db_session, test_project, test_product, test_price):
+def test_recompute_and_store_entitlements(db_session, test_project, test_product, test_price, now_utc):
     """Test recomputing and storing entitlements."""
     user_id = "user_recompute"
 
@@ -211,8 +169,8 @@ def test_recompute_and_store_entitlements(db_session, test_project, test_product
         project_id=test_project.id,
         price_id=test_price.id,
         status=SubscriptionStatus.ACTIVE,
-        current_period_start=datetime.utcnow(),
-        current_period_end=datetime.utcnow() + timedelta(days=30),
+        current_period_start=now_utc,
+        current_period_end=now_utc + timedelta(days=30),
         cancel_at_period_end=False,
     )
     db_session.add(subscription)
@@ -231,7 +189,7 @@ def test_recompute_and_store_entitlements(db_session, test_project, test_product
     assert all(e.is_active is True for e in stored)
 
 
-def test_recompute_entitlements_updates_existing(db_session, test_project, test_product, test_price):
+def test_recompute_entitlements_updates_existing(db_session, test_project, test_product, test_price, now_utc):
     """Test that recomputing updates existing entitlements."""
     user_id = "user_update"
 
@@ -242,8 +200,8 @@ def test_recompute_entitlements_updates_existing(db_session, test_project, test_
         project_id=test_project.id,
         price_id=test_price.id,
         status=SubscriptionStatus.ACTIVE,
-        current_period_start=datetime.utcnow(),
-        current_period_end=datetime.utcnow() + timedelta(days=30),
+        current_period_start=now_utc,
+        current_period_end=now_utc + timedelta(days=30),
         cancel_at_period_end=False,
     )
     db_session.add(subscription1)
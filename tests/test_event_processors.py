@@ -1,8 +1,9 @@
 """Tests for event processors."""
 
 import pytest
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import Mock, patch
 from datetime import datetime
+import uuid
 
 from billing_service.event_processors import (
     CheckoutSessionCompletedProcessor,
@@ -62,7 +63,7 @@ def test_event_router_registers_processor():
     router.register_processor(processor)
 
     assert "checkout.session.completed" in router._processors
-    assert router._processors["checkout.session.completed"] == processor
+    assert router._processors["checkout.session.completed"] == processor.process
 
 
 def test_event_router_processes_event():
@@ -80,11 +81,34 @@ def test_event_router_processes_event():
     mock_event.type = "test.event"
     mock_event.id = "evt_test123"
 
-    with patch("billing_service.webhook_processors.is_event_processed", return_value=False):
-        with patch("billing_service.webhook_processors.mark_event_processed"):
+    with patch("billing_service.webhook_processors.check_and_claim_event", return_value=True):
+        with patch("billing_service.webhook_processors.mark_event_processed") as mock_mark:
             router.process_event(mock_event)
 
     processor.process.assert_called_once_with(mock_event)
+    # The short processing claim is extended to the processed TTL only after success
+    mock_mark.assert_called_once_with("evt_test123")
+
+
+def test_event_router_rejects_registration_after_freeze():
+    """Test event router cannot be modified once frozen."""
+    from billing_service.webhook_processors import EventRouter
+
+    router = EventRouter()
+    processor = Mock()
+    processor.get_event_type.return_value = "test.event"
+    router.register_processor(processor)
+
+    router.freeze()
+
+    late_processor = Mock()
+    late_processor.get_event_type.return_value = "test.late"
+    with pytest.raises(RuntimeError):
+        router.register_processor(late_processor)
+    assert router._processors["test.event"] == processor.process
+    assert router.processors == {"test.event": processor.process}
+    with pytest.raises(TypeError):
+        router.processors["test.late"] = late_processor.process
 
 
 def test_event_router_skips_processed_event():
@@ -102,7 +126,7 @@ def test_event_router_skips_processed_event():
     mock_event.type = "test.event"
     mock_event.id = "evt_test123"
 
-    with patch("billing_service.webhook_processors.is_event_processed", return_value=True):
+    with patch("billing_service.webhook_processors.check_and_claim_event", return_value=False):
         router.process_event(mock_event)
 
     processor.process.assert_not_called()
@@ -118,9 +142,63 @@ def test_event_router_handles_unknown_event():
     mock_event.type = "unknown.event"
     mock_event.id = "evt_test123"
 
-    with patch("billing_service.webhook_processors.is_event_processed", return_value=False):
-        with patch("billing_service.webhook_processors.mark_event_processed") as mock_mark:
-            router.process_event(mock_event)
+    with patch("billing_service.webhook_processors.check_and_claim_event", return_value=True) as mock_claim:
+        with patch("billing_service.webhook_processors.release_event_claim") as mock_release:
+            with patch("billing_service.webhook_processors.mark_event_processed") as mock_mark:
+                router.process_event(mock_event)
 
-    # Should mark as processed even if no processor
+    # Should mark the event processed even if no processor
+    mock_claim.assert_called_once_with("evt_test123")
     mock_mark.assert_called_once_with("evt_test123")
+    mock_release.assert_not_called()
+
+
+@patch("billing_service.event_processors.SessionLocal")
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+@patch("billing_service.event_processors.recompute_and_store_entitlements")
+def test_entitlement_refreshes_are_deduplicated(mock_recompute, mock_invalidate, mock_session_local):
+    """Test queued entitlement refreshes run once per user/project after the event commits."""
+    from billing_service.event_processors import (
+        processor_session,
+        queue_entitlement_refresh,
+    )
+
+    project_id = uuid.uuid4()
+    db = Mock()
+    db.info = {}
+    mock_session_local.return_value = db
+
+    with processor_session() as session:
+        queue_entitlement_refresh(session, "user_123", project_id)
+        queue_entitlement_refresh(session, "user_123", project_id)
+
+    mock_recompute.assert_called_once_with(db, "user_123", project_id)
+    db.commit.assert_called_once()
+    db.close.assert_called_once()
+    assert list(mock_invalidate.call_args[0][0]) == [("user_123", str(project_id))]
+
+
+@patch("billing_service.event_processors.SessionLocal")
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+@patch("billing_service.event_processors.recompute_and_store_entitlements")
+def test_processor_session_rolls_back_on_error(mock_recompute, mock_invalidate, mock_session_local):
+    """Test a failing processor discards queued refreshes and rolls back."""
+    from billing_service.event_processors import (
+        processor_session,
+        queue_entitlement_refresh,
+    )
+
+    db = Mock()
+    db.info = {}
+    mock_session_local.return_value = db
+
+    with pytest.raises(RuntimeError):
+        with processor_session() as session:
+            queue_entitlement_refresh(session, "user_123", uuid.uuid4())
+            raise RuntimeError("Processing error")
+
+    mock_recompute.assert_not_called()
+    mock_invalidate.assert_not_called()
+    db.commit.assert_not_called()
+    db.rollback.assert_called_once()
+    db.close.assert_called_once()
@@ -1,7 +1,7 @@
 """Additional tests for event processors."""
 
 import pytest
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import Mock, patch
 from datetime import datetime
 
 from billing_service.event_processors import (
@@ -69,11 +69,16 @@ def test_event_router_error_handling():
     mock_event.type = "test.error"
     mock_event.id = "evt_error123"
     
-    with patch("billing_service.webhook_processors.is_event_processed", return_value=False):
-        # Should raise exception, not mark as processed
-        # The processor raises Exception, which the router propagates
-        with pytest.raises(Exception, match="Processing error"):  # noqa: B017
-            router.process_event(mock_event)
+    with patch("billing_service.webhook_processors.check_and_claim_event", return_value=True):
+        with patch("billing_service.webhook_processors.release_event_claim") as mock_release:
+            with patch("billing_service.webhook_processors.mark_event_processed") as mock_mark:
+                # Should raise exception and release the claim
+                # The processor raises Exception, which the router propagates
+                with pytest.raises(Exception, match="Processing error"):  # noqa: B017
+                    router.process_event(mock_event)
+
+    mock_release.assert_called_once_with("evt_error123")
+    mock_mark.assert_not_called()
 
 
 def test_event_router_logs_warnings():
@@ -87,12 +92,12 @@ def test_event_router_logs_warnings():
     mock_event.type = "unknown.event.type"
     mock_event.id = "evt_unknown123"
     
-    with patch("billing_service.webhook_processors.is_event_processed", return_value=False):
-        with patch("billing_service.webhook_processors.mark_event_processed") as mock_mark:
-            with patch("billing_service.webhook_processors.logger") as mock_logger:
-                router.process_event(mock_event)
-                
-                # Should log warning
-                mock_logger.warning.assert_called()
-                # Should still mark as processed
-                mock_mark.assert_called_once_with("evt_unknown123")
+    with patch("billing_service.webhook_processors.check_and_claim_event", return_value=True) as mock_claim, \
+            patch("billing_service.webhook_processors.mark_event_processed"):
+        with patch("billing_service.webhook_processors.logger") as mock_logger:
+            router.process_event(mock_event)
+            
+            # Should log warning
+            mock_logger.warning.assert_called()
+            # Should still hold the claim
+            mock_claim.assert_called_once_with("evt_unknown123")
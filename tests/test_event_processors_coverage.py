@@ -3,7 +3,6 @@
 import pytest
 import uuid
 from unittest.mock import Mock, patch
-from datetime import datetime
 
 from billing_service.event_processors import (
     CheckoutSessionCompletedProcessor,
@@ -20,11 +19,10 @@ from billing_service.models import (
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_checkout_session_completed_subscription_creates_subscription(mock_invalidate, mock_recompute, mock_session_local, db_engine, test_project, test_product, test_price):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_checkout_session_completed_subscription_creates_subscription(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, test_project, test_product, test_price, now_utc):
     """Test checkout processor creates subscription for subscription mode."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     test_db = TestingSessionLocal()
     
     def create_session():
@@ -55,8 +53,8 @@ def test_checkout_session_completed_subscription_creates_subscription(mock_inval
     # Set all required attributes explicitly
     mock_stripe_sub.id = unique_sub_id
     mock_stripe_sub.status = "active"
-    mock_stripe_sub.current_period_start = int(datetime.utcnow().timestamp())
-    mock_stripe_sub.current_period_end = int((datetime.utcnow().timestamp() + 86400 * 30))
+    mock_stripe_sub.current_period_start = int(now_utc.timestamp())
+    mock_stripe_sub.current_period_end = int((now_utc.timestamp() + 86400 * 30))
     mock_stripe_sub.cancel_at_period_end = False
     # Set canceled_at to None - this is critical for the test
     # Use configure_mock to ensure it's not returning a Mock object
@@ -85,11 +83,10 @@ def test_checkout_session_completed_subscription_creates_subscription(mock_inval
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_invoice_payment_succeeded_updates_subscription_period(mock_invalidate, mock_recompute, mock_session_local, db_engine, test_project, test_product, test_price):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_invoice_payment_succeeded_updates_subscription_period(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, test_project, test_product, test_price, now_utc):
     """Test invoice processor updates subscription period."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     test_db = TestingSessionLocal()
     
     def create_session():
@@ -113,8 +110,8 @@ def test_invoice_payment_succeeded_updates_subscription_period(mock_invalidate,
             project_id=test_project.id,
             price_id=test_price.id,
             status=SubscriptionStatus.ACTIVE,
-            current_period_start=datetime.utcnow(),
-            current_period_end=datetime.utcnow(),
+            current_period_start=now_utc,
+            current_period_end=now_utc,
             cancel_at_period_end=False,
         )
         test_db.add(subscription)
@@ -126,8 +123,8 @@ def test_invoice_payment_succeeded_updates_subscription_period(mock_invalidate,
         mock_invoice = Mock()
         mock_invoice.subscription = unique_sub_id
         mock_invoice.customer = "cus_test123"
-        mock_invoice.period_start = int(datetime.utcnow().timestamp())
-        mock_invoice.period_end = int((datetime.utcnow().timestamp() + 86400 * 30))
+        mock_invoice.period_start = int(now_utc.timestamp())
+        mock_invoice.period_end = int((now_utc.timestamp() + 86400 * 30))
         mock_event.data.object = mock_invoice
         
         processor.process(mock_event)
@@ -146,11 +143,10 @@ def test_invoice_payment_succeeded_updates_subscription_period(mock_invalidate,
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_charge_refunded_processor_handles_missing_purchase(mock_invalidate, mock_recompute, mock_session_local, db_engine):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_charge_refunded_processor_handles_missing_purchase(mock_invalidate, mock_recompute, mock_session_local, db_session_factory):
     """Test charge refunded processor handles missing purchase gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     test_db = TestingSessionLocal()
     
     def create_session():
@@ -184,11 +180,10 @@ def test_charge_refunded_processor_handles_missing_purchase(mock_invalidate, moc
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_checkout_session_unknown_mode(mock_invalidate, mock_recompute, mock_session_local, db_engine, test_project):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_checkout_session_unknown_mode(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, test_project):
     """Test checkout processor handles unknown checkout mode gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -212,11 +207,10 @@ def test_checkout_session_unknown_mode(mock_invalidate, mock_recompute, mock_ses
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_checkout_session_metadata_as_stripe_object(mock_invalidate, mock_recompute, mock_session_local, db_engine, test_project):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_checkout_session_metadata_as_stripe_object(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, test_project, now_utc):
     """Test checkout processor handles metadata as Stripe object (not dict)."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -243,8 +237,8 @@ def test_checkout_session_metadata_as_stripe_object(mock_invalidate, mock_recomp
     mock_stripe_sub = Mock()
     mock_stripe_sub.id = "sub_test123"
     mock_stripe_sub.status = "active"
-    mock_stripe_sub.current_period_start = int(datetime.utcnow().timestamp())
-    mock_stripe_sub.current_period_end = int((datetime.utcnow().timestamp() + 86400 * 30))
+    mock_stripe_sub.current_period_start = int(now_utc.timestamp())
+    mock_stripe_sub.current_period_end = int((now_utc.timestamp() + 86400 * 30))
     mock_stripe_sub.items.data = [Mock()]
     mock_stripe_sub.items.data[0].price.id = "price_test123"
     
@@ -256,11 +250,10 @@ def test_checkout_session_metadata_as_stripe_object(mock_invalidate, mock_recomp
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_checkout_payment_creates_purchase(mock_invalidate, mock_recompute, mock_session_local, db_engine, test_project, test_product, test_price):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_checkout_payment_creates_purchase(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, test_project, test_product, test_price):
     """Test checkout processor creates purchase for payment mode."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     test_db = TestingSessionLocal()
     
     def create_session():
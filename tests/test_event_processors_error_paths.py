@@ -1,8 +1,9 @@
 """Additional error path and edge case tests for event processors."""
 
+import uuid
+
 import pytest
 from unittest.mock import Mock, patch
-from datetime import datetime
 
 from billing_service.event_processors import (
     CheckoutSessionCompletedProcessor,
@@ -21,11 +22,10 @@ from billing_service.models import (
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_checkout_session_missing_metadata(mock_invalidate, mock_recompute, mock_session_local, db_engine):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_checkout_session_missing_metadata(mock_invalidate, mock_recompute, mock_session_local, db_session_factory):
     """Test checkout processor handles missing metadata gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -49,11 +49,10 @@ def test_checkout_session_missing_metadata(mock_invalidate, mock_recompute, mock
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_checkout_session_missing_project(mock_invalidate, mock_recompute, mock_session_local, db_engine):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_checkout_session_missing_project(mock_invalidate, mock_recompute, mock_session_local, db_session_factory):
     """Test checkout processor handles missing project gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -78,11 +77,10 @@ def test_checkout_session_missing_project(mock_invalidate, mock_recompute, mock_
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_checkout_session_missing_subscription_id(mock_invalidate, mock_recompute, mock_session_local, db_engine, test_project):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_checkout_session_missing_subscription_id(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, test_project):
     """Test checkout processor handles missing subscription ID gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -107,11 +105,10 @@ def test_checkout_session_missing_subscription_id(mock_invalidate, mock_recomput
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_checkout_session_stripe_api_failure(mock_invalidate, mock_recompute, mock_session_local, db_engine, test_project):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_checkout_session_stripe_api_failure(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, test_project):
     """Test checkout processor handles Stripe API failures gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -126,7 +123,9 @@ def test_checkout_session_stripe_api_failure(mock_invalidate, mock_recompute, mo
     mock_session = Mock()
     mock_session.mode = "subscription"
     mock_session.metadata = {"user_id": "user_123", "project_id": test_project.project_id}
-    mock_session.subscription = "sub_test123"
+    # Unique ID: other modules insert sub_test123 into the shared database, and an existing
+    # subscription takes the idempotency early return before Stripe is ever called
+    mock_session.subscription = f"sub_{uuid.uuid4().hex[:24]}"
     mock_event.data.object = mock_session
     mock_event.id = "evt_test123"
     
@@ -146,11 +145,10 @@ def test_checkout_session_stripe_api_failure(mock_invalidate, mock_recompute, mo
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_checkout_session_missing_price(mock_invalidate, mock_recompute, mock_session_local, db_engine, test_project):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_checkout_session_missing_price(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, test_project, now_utc):
     """Test checkout processor handles missing price gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -173,8 +171,8 @@ def test_checkout_session_missing_price(mock_invalidate, mock_recompute, mock_se
     mock_stripe_sub = Mock()
     mock_stripe_sub.id = "sub_test123"
     mock_stripe_sub.status = "active"
-    mock_stripe_sub.current_period_start = int(datetime.utcnow().timestamp())
-    mock_stripe_sub.current_period_end = int((datetime.utcnow().timestamp() + 86400 * 30))
+    mock_stripe_sub.current_period_start = int(now_utc.timestamp())
+    mock_stripe_sub.current_period_end = int((now_utc.timestamp() + 86400 * 30))
     mock_stripe_sub.items.data = [Mock()]
     mock_stripe_sub.items.data[0].price.id = "price_nonexistent"
     
@@ -186,11 +184,10 @@ def test_checkout_session_missing_price(mock_invalidate, mock_recompute, mock_se
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_checkout_payment_missing_payment_intent(mock_invalidate, mock_recompute, mock_session_local, db_engine, test_project):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_checkout_payment_missing_payment_intent(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, test_project):
     """Test checkout processor handles missing payment intent gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -215,11 +212,10 @@ def test_checkout_payment_missing_payment_intent(mock_invalidate, mock_recompute
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_checkout_payment_missing_charges(mock_invalidate, mock_recompute, mock_session_local, db_engine, test_project):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_checkout_payment_missing_charges(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, test_project):
     """Test checkout processor handles missing charges gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -250,11 +246,10 @@ def test_checkout_payment_missing_charges(mock_invalidate, mock_recompute, mock_
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_invoice_payment_no_subscription(mock_invalidate, mock_recompute, mock_session_local, db_engine):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_invoice_payment_no_subscription(mock_invalidate, mock_recompute, mock_session_local, db_session_factory):
     """Test invoice processor handles invoice without subscription gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -277,11 +272,10 @@ def test_invoice_payment_no_subscription(mock_invalidate, mock_recompute, mock_s
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_invoice_payment_subscription_not_found(mock_invalidate, mock_recompute, mock_session_local, db_engine):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_invoice_payment_subscription_not_found(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, now_utc):
     """Test invoice processor handles missing subscription gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -297,6 +291,8 @@ def test_invoice_payment_subscription_not_found(mock_invalidate, mock_recompute,
     mock_invoice = Mock()
     mock_invoice.subscription = "sub_nonexistent"
     mock_invoice.customer = "cus_test123"
+    mock_invoice.period_start = int(now_utc.timestamp())
+    mock_invoice.period_end = int(now_utc.timestamp())
     mock_event.data.object = mock_invoice
     
     # Should not raise exception
@@ -305,11 +301,10 @@ def test_invoice_payment_subscription_not_found(mock_invalidate, mock_recompute,
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_subscription_updated_missing_id(mock_invalidate, mock_recompute, mock_session_local, db_engine):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_subscription_updated_missing_id(mock_invalidate, mock_recompute, mock_session_local, db_session_factory):
     """Test subscription updated processor handles missing subscription ID gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -332,11 +327,10 @@ def test_subscription_updated_missing_id(mock_invalidate, mock_recompute, mock_s
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_subscription_updated_not_found(mock_invalidate, mock_recompute, mock_session_local, db_engine):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_subscription_updated_not_found(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, now_utc):
     """Test subscription updated processor handles missing subscription gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -352,6 +346,10 @@ def test_subscription_updated_not_found(mock_invalidate, mock_recompute, mock_se
     mock_subscription = Mock()
     mock_subscription.id = "sub_nonexistent"
     mock_subscription.status = "active"
+    mock_subscription.current_period_start = int(now_utc.timestamp())
+    mock_subscription.current_period_end = int(now_utc.timestamp())
+    mock_subscription.cancel_at_period_end = False
+    mock_subscription.configure_mock(canceled_at=None)
     mock_event.data.object = mock_subscription
     
     # Should not raise exception
@@ -360,11 +358,10 @@ def test_subscription_updated_not_found(mock_invalidate, mock_recompute, mock_se
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_subscription_deleted_missing_id(mock_invalidate, mock_recompute, mock_session_local, db_engine):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_subscription_deleted_missing_id(mock_invalidate, mock_recompute, mock_session_local, db_session_factory):
     """Test subscription deleted processor handles missing subscription ID gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -387,11 +384,10 @@ def test_subscription_deleted_missing_id(mock_invalidate, mock_recompute, mock_s
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_subscription_deleted_not_found(mock_invalidate, mock_recompute, mock_session_local, db_engine):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_subscription_deleted_not_found(mock_invalidate, mock_recompute, mock_session_local, db_session_factory):
     """Test subscription deleted processor handles missing subscription gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -414,11 +410,10 @@ def test_subscription_deleted_not_found(mock_invalidate, mock_recompute, mock_se
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_charge_refunded_missing_id(mock_invalidate, mock_recompute, mock_session_local, db_engine):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_charge_refunded_missing_id(mock_invalidate, mock_recompute, mock_session_local, db_session_factory):
     """Test charge refunded processor handles missing charge ID gracefully."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -437,3 +432,89 @@ def test_charge_refunded_missing_id(mock_invalidate, mock_recompute, mock_sessio
     
     # Should not raise exception
     processor.process(mock_event)
+
+
+@patch("billing_service.event_processors.stripe.Subscription.retrieve")
+def test_checkout_subscription_concurrent_insert(mock_retrieve, now_utc):
+    """Test a subscription inserted concurrently after the existence check is skipped."""
+    from sqlalchemy.exc import IntegrityError
+
+    processor = CheckoutSessionCompletedProcessor()
+
+    mock_stripe_sub = Mock()
+    mock_stripe_sub.status = "active"
+    mock_stripe_sub.current_period_start = int(now_utc.timestamp())
+    mock_stripe_sub.current_period_end = int(now_utc.timestamp())
+    mock_stripe_sub.cancel_at_period_end = False
+    mock_stripe_sub.configure_mock(canceled_at=None)
+    mock_stripe_sub.items.data = [Mock()]
+    mock_retrieve.return_value = mock_stripe_sub
+
+    mock_session_obj = Mock()
+    mock_session_obj.subscription = "sub_race123"
+
+    db = Mock()
+    db.info = {}
+    # Existence check finds nothing, the price lookup succeeds, then the re-select finds the row
+    db.query.return_value.filter.return_value.first.side_effect = [None, Mock(id=uuid.uuid4()), Mock()]
+    db.flush.side_effect = IntegrityError("INSERT", {}, Exception("duplicate key"))
+
+    processor._process_subscription(mock_session_obj, "user_123", uuid.uuid4(), db)
+
+    # Once to release the connection for the Stripe call, once for the duplicate insert
+    assert db.rollback.call_count == 2
+    assert db.info == {}  # No entitlement refresh queued
+
+
+@patch("billing_service.event_processors.stripe.Subscription.retrieve")
+def test_checkout_subscription_other_integrity_error_propagates(mock_retrieve, now_utc):
+    """Test a constraint failure that isn't a duplicate subscription is re-raised for retry."""
+    from sqlalchemy.exc import IntegrityError
+
+    processor = CheckoutSessionCompletedProcessor()
+
+    mock_stripe_sub = Mock()
+    mock_stripe_sub.status = "active"
+    mock_stripe_sub.current_period_start = int(now_utc.timestamp())
+    mock_stripe_sub.current_period_end = int(now_utc.timestamp())
+    mock_stripe_sub.cancel_at_period_end = False
+    mock_stripe_sub.configure_mock(canceled_at=None)
+    mock_stripe_sub.items.data = [Mock()]
+    mock_retrieve.return_value = mock_stripe_sub
+
+    mock_session_obj = Mock()
+    mock_session_obj.subscription = "sub_fk123"
+
+    db = Mock()
+    db.info = {}
+    # Existence check and the post-rollback re-select both find nothing
+    db.query.return_value.filter.return_value.first.side_effect = [None, Mock(id=uuid.uuid4()), None]
+    db.flush.side_effect = IntegrityError("INSERT", {}, Exception("FOREIGN KEY constraint failed"))
+
+    with pytest.raises(IntegrityError):
+        processor._process_subscription(mock_session_obj, "user_123", uuid.uuid4(), db)
+
+    assert db.rollback.call_count == 2
+    assert db.info == {}  # No entitlement refresh queued
+
+
+@patch("billing_service.event_processors.stripe.Subscription.retrieve")
+def test_checkout_subscription_releases_connection_before_stripe_call(mock_retrieve):
+    """Test the database connection is released before calling the Stripe API."""
+
+    processor = CheckoutSessionCompletedProcessor()
+
+    calls = Mock()
+    db = Mock()
+    db.query.return_value.filter.return_value.first.return_value = None
+    calls.attach_mock(db.rollback, "rollback")
+    calls.attach_mock(mock_retrieve, "retrieve")
+    mock_retrieve.side_effect = Exception("Stripe API error")
+
+    mock_session_obj = Mock()
+    mock_session_obj.subscription = "sub_release123"
+
+    with pytest.raises(Exception, match="Stripe API error"):
+        processor._process_subscription(mock_session_obj, "user_123", uuid.uuid4(), db)
+
+    assert [c[0] for c in calls.mock_calls] == ["rollback", "retrieve"]
@@ -2,8 +2,7 @@
 
 import pytest
 import uuid
-from unittest.mock import Mock, patch, MagicMock
-from datetime import datetime
+from unittest.mock import Mock, patch
 
 from billing_service.event_processors import (
     CheckoutSessionCompletedProcessor,
@@ -24,7 +23,7 @@ from billing_service.models import (
 )
 
 
-def test_checkout_session_completed_processor_handles_subscription_mode(db_engine, test_project):
+def test_checkout_session_completed_processor_handles_subscription_mode(db_engine, test_project, now_utc):
     """Test checkout processor handles subscription mode."""
     processor = CheckoutSessionCompletedProcessor()
     
@@ -43,8 +42,8 @@ def test_checkout_session_completed_processor_handles_subscription_mode(db_engin
     mock_stripe_sub = Mock()
     mock_stripe_sub.id = unique_sub_id
     mock_stripe_sub.status = "active"
-    mock_stripe_sub.current_period_start = int(datetime.utcnow().timestamp())
-    mock_stripe_sub.current_period_end = int((datetime.utcnow().timestamp() + 86400 * 30))
+    mock_stripe_sub.current_period_start = int(now_utc.timestamp())
+    mock_stripe_sub.current_period_end = int((now_utc.timestamp() + 86400 * 30))
     
     with patch('stripe.Subscription.retrieve', return_value=mock_stripe_sub):
         # Should process without error (may fail due to missing price, but should handle gracefully)
@@ -55,10 +54,9 @@ def test_checkout_session_completed_processor_handles_subscription_mode(db_engin
             pass
 
 
-def test_invoice_payment_succeeded_processor_handles_subscription(db_engine, test_project, test_product, test_price):
+def test_invoice_payment_succeeded_processor_handles_subscription(db_session_factory, test_project, test_product, test_price, now_utc):
     """Test invoice processor handles subscription invoices."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     test_db = TestingSessionLocal()
     
     processor = InvoicePaymentSucceededProcessor()
@@ -74,8 +72,8 @@ def test_invoice_payment_succeeded_processor_handles_subscription(db_engine, tes
             project_id=test_project.id,
             price_id=test_price.id,
             status=SubscriptionStatus.ACTIVE,
-            current_period_start=datetime.utcnow(),
-            current_period_end=datetime.utcnow(),
+            current_period_start=now_utc,
+            current_period_end=now_utc,
             cancel_at_period_end=False,
         )
         test_db.add(subscription)
@@ -100,11 +98,10 @@ def test_invoice_payment_succeeded_processor_handles_subscription(db_engine, tes
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_subscription_updated_processor_updates_status(mock_invalidate, mock_recompute, mock_session_local, db_engine, test_project, test_product, test_price):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_subscription_updated_processor_updates_status(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, test_project, test_product, test_price, now_utc):
     """Test subscription updated processor updates subscription status."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     test_db = TestingSessionLocal()
     
     def create_session():
@@ -127,8 +124,8 @@ def test_subscription_updated_processor_updates_status(mock_invalidate, mock_rec
             project_id=test_project.id,
             price_id=test_price.id,
             status=SubscriptionStatus.ACTIVE,
-            current_period_start=datetime.utcnow(),
-            current_period_end=datetime.utcnow(),
+            current_period_start=now_utc,
+            current_period_end=now_utc,
             cancel_at_period_end=False,
         )
         test_db.add(subscription)
@@ -139,10 +136,10 @@ def test_subscription_updated_processor_updates_status(mock_invalidate, mock_rec
         mock_subscription = Mock()
         mock_subscription.id = unique_sub_id
         mock_subscription.status = "canceled"
-        mock_subscription.current_period_start = int(datetime.utcnow().timestamp())
-        mock_subscription.current_period_end = int((datetime.utcnow().timestamp() + 86400 * 30))
+        mock_subscription.current_period_start = int(now_utc.timestamp())
+        mock_subscription.current_period_end = int((now_utc.timestamp() + 86400 * 30))
         mock_subscription.cancel_at_period_end = False
-        mock_subscription.canceled_at = int(datetime.utcnow().timestamp())  # Add canceled_at timestamp
+        mock_subscription.canceled_at = int(now_utc.timestamp())  # Add canceled_at timestamp
         mock_event.data.object = mock_subscription
         
         # Mock Stripe subscription retrieval
@@ -163,11 +160,10 @@ def test_subscription_updated_processor_updates_status(mock_invalidate, mock_rec
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_subscription_deleted_processor_cancels_subscription(mock_invalidate, mock_recompute, mock_session_local, db_engine, test_project, test_product, test_price):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_subscription_deleted_processor_cancels_subscription(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, test_project, test_product, test_price, now_utc):
     """Test subscription deleted processor cancels subscription."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     test_db = TestingSessionLocal()
     
     def create_session():
@@ -190,8 +186,8 @@ def test_subscription_deleted_processor_cancels_subscription(mock_invalidate, mo
             project_id=test_project.id,
             price_id=test_price.id,
             status=SubscriptionStatus.ACTIVE,
-            current_period_start=datetime.utcnow(),
-            current_period_end=datetime.utcnow(),
+            current_period_start=now_utc,
+            current_period_end=now_utc,
             cancel_at_period_end=False,
         )
         test_db.add(subscription)
@@ -219,11 +215,10 @@ def test_subscription_deleted_processor_cancels_subscription(mock_invalidate, mo
 
 @patch("billing_service.event_processors.SessionLocal")
 @patch("billing_service.event_processors.recompute_and_store_entitlements")
-@patch("billing_service.event_processors.invalidate_entitlements_cache")
-def test_charge_refunded_processor_refunds_purchase(mock_invalidate, mock_recompute, mock_session_local, db_engine, test_project, test_product, test_price):
+@patch("billing_service.event_processors.invalidate_entitlements_caches")
+def test_charge_refunded_processor_refunds_purchase(mock_invalidate, mock_recompute, mock_session_local, db_session_factory, test_project, test_product, test_price, now_utc):
     """Test charge refunded processor refunds purchase."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     test_db = TestingSessionLocal()
     
     def create_session():
@@ -248,7 +243,7 @@ def test_charge_refunded_processor_refunds_purchase(mock_invalidate, mock_recomp
             status=PurchaseStatus.SUCCEEDED,
             amount=1000,
             currency="usd",
-            valid_from=datetime.utcnow(),
+            valid_from=now_utc,
         )
         test_db.add(purchase)
         test_db.commit()
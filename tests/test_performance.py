@@ -6,51 +6,22 @@ from statistics import median
 from unittest.mock import patch
 import httpx
 
+from billing_service.auth import verify_project_api_key
+from billing_service.database import get_db
 from billing_service.main import app
 
 
 @pytest.mark.performance
 @pytest.mark.asyncio
-async def test_entitlement_check_p95_latency(client, db_engine, test_project):
+async def test_entitlement_check_p95_latency(client, get_db_override, test_project, test_api_key):
     """Validate p95 latency < 100ms for entitlement checks."""
-    import hashlib
-    from billing_service.main import app
-    from billing_service.database import get_db
-    from billing_service.auth import verify_project_api_key
-    from billing_service.cache import get_cached_entitlements
-    
-    # Update test project - use a unique user_id to avoid conflicts
-    from sqlalchemy.orm import sessionmaker
-    from billing_service.models import Project
-    TestingSessionLocal = sessionmaker(bind=db_engine)
-    
-    setup_db = TestingSessionLocal()
-    try:
-        api_key = "test_perf_p95_key"
-        api_key_hash = hashlib.sha256(api_key.encode()).hexdigest()
-        # Query project from DB using engine to get fresh object
-        fresh_project = setup_db.query(Project).filter(Project.id == test_project.id).first()
-        fresh_project.api_key_hash = api_key_hash
-        setup_db.commit()
-        setup_db.refresh(fresh_project)
-        test_project_for_override = fresh_project
-    finally:
-        setup_db.close()
-    
-    # Use FastAPI dependency override - create a new session per request for thread safety
-    async def override_get_db():
-        test_session = TestingSessionLocal()
-        try:
-            yield test_session
-        finally:
-            test_session.close()
     
     # Override verify_project_api_key - use the exact function reference
     async def override_verify_project_api_key():
-        return test_project_for_override
+        return test_project
     
     # Override both get_db and verify_project_api_key
-    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_db] = get_db_override
     app.dependency_overrides[verify_project_api_key] = override_verify_project_api_key
     
     # Mock cache to return None (cache miss)
@@ -63,7 +34,7 @@ async def test_entitlement_check_p95_latency(client, db_engine, test_project):
                 start = time.time()
                 response = await client.get(
                     "/api/v1/entitlements?user_id=test_user_cache",
-                    headers={"Authorization": f"Bearer {api_key}"},
+                    headers={"Authorization": f"Bearer {test_api_key}"},
                 )
                 assert response.status_code == 200
                 latencies.append((time.time() - start) * 1000)  # Convert to ms
@@ -80,47 +51,15 @@ async def test_entitlement_check_p95_latency(client, db_engine, test_project):
 
 @pytest.mark.performance
 @pytest.mark.asyncio
-async def test_entitlement_check_cache_hit_latency(client, db_engine, test_project):
+async def test_entitlement_check_cache_hit_latency(client, test_project, test_api_key, get_db_override, now_utc):
     """Validate cache hit latency is very fast."""
-    import hashlib
-    from billing_service.main import app
-    from billing_service.database import get_db
-    from billing_service.auth import verify_project_api_key
-    from datetime import datetime
-    
-    # Update test project - get fresh object from engine to avoid thread issues
-    from sqlalchemy.orm import sessionmaker
-    from billing_service.models import Project
-    TestingSessionLocal = sessionmaker(bind=db_engine)
-    test_db = TestingSessionLocal()
-    try:
-        api_key = "test_perf_cache_key"
-        api_key_hash = hashlib.sha256(api_key.encode()).hexdigest()
-        # Query project from DB using engine to get fresh object
-        fresh_project = test_db.query(Project).filter(Project.id == test_project.id).first()
-        fresh_project.api_key_hash = api_key_hash
-        test_db.commit()
-        test_db.refresh(fresh_project)
-        # Use fresh_project in overrides
-        test_project_for_override = fresh_project
-    finally:
-        test_db.close()
-    
-    # Use FastAPI dependency override - create a new session per request for thread safety
-    # Use db_engine directly to avoid thread issues
-    async def override_get_db():
-        test_session = TestingSessionLocal()
-        try:
-            yield test_session
-        finally:
-            test_session.close()
     
     # Override verify_project_api_key - use the exact function reference
     async def override_verify_project_api_key():
-        return test_project_for_override
+        return test_project
     
     # Override both get_db and verify_project_api_key
-    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_db] = get_db_override
     app.dependency_overrides[verify_project_api_key] = override_verify_project_api_key
     
     # Mock cache hit
@@ -128,7 +67,7 @@ async def test_entitlement_check_cache_hit_latency(client, db_engine, test_proje
         {
             "feature_code": "feature1",
             "is_active": True,
-            "valid_from": datetime.utcnow().isoformat(),
+            "valid_from": now_utc.isoformat(),
             "valid_to": None,
             "source": "subscription",
         }
@@ -143,7 +82,7 @@ async def test_entitlement_check_cache_hit_latency(client, db_engine, test_proje
                 start = time.time()
                 response = await client.get(
                     "/api/v1/entitlements?user_id=test_user_cache",
-                    headers={"Authorization": f"Bearer {api_key}"},
+                    headers={"Authorization": f"Bearer {test_api_key}"},
                 )
                 assert response.status_code == 200
                 latencies.append((time.time() - start) * 1000)  # Convert to ms
@@ -2,16 +2,19 @@
 
 import pytest
 import uuid
-from unittest.mock import Mock, patch, MagicMock
-from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+from datetime import timedelta
 
+from billing_service.entitlements import recompute_and_store_entitlements
 from billing_service.reconciliation import (
     reconcile_all,
     reconcile_subscription,
     reconcile_purchases_for_project,
+    reconcile_subscriptions_for_project,
     ReconciliationResult,
 )
 from billing_service.models import (
+    Entitlement,
     Project,
     Subscription,
     Purchase,
@@ -23,12 +26,11 @@ from billing_service.models import (
 )
 
 
-def test_reconcile_subscription_status_update(db_engine, test_project, test_product, test_price):
+def test_reconcile_subscription_status_update(db_session_factory, test_project, test_product, test_price, now_utc):
     """Test reconciling subscription status changes."""
     import stripe
-    from sqlalchemy.orm import sessionmaker
     
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     test_db = TestingSessionLocal()
     
     # Use unique IDs to avoid conflicts
@@ -42,15 +44,15 @@ def test_reconcile_subscription_status_update(db_engine, test_project, test_prod
             project_id=test_project.id,
             price_id=test_price.id,
             status=SubscriptionStatus.ACTIVE,
-            current_period_start=datetime.utcnow(),
-            current_period_end=datetime.utcnow() + timedelta(days=30),
+            current_period_start=now_utc,
+            current_period_end=now_utc + timedelta(days=30),
             cancel_at_period_end=False,
         )
         test_db.add(subscription)
         test_db.commit()
 
         # Mock Stripe subscription with updated status
-        now = datetime.utcnow()
+        now = now_utc
         mock_stripe_sub = Mock()
         mock_stripe_sub.status = "canceled"
         mock_stripe_sub.current_period_start = int(now.timestamp())
@@ -71,12 +73,11 @@ def test_reconcile_subscription_status_update(db_engine, test_project, test_prod
         test_db.close()
 
 
-def test_reconcile_subscription_period_update(db_engine, test_project, test_product, test_price):
+def test_reconcile_subscription_period_update(db_session_factory, test_project, test_product, test_price, now_utc):
     """Test reconciling subscription period changes."""
     import stripe
-    from sqlalchemy.orm import sessionmaker
     
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     test_db = TestingSessionLocal()
     
     # Use unique IDs to avoid conflicts
@@ -84,7 +85,7 @@ def test_reconcile_subscription_period_update(db_engine, test_project, test_prod
     
     try:
         # Create subscription
-        now = datetime.utcnow()
+        now = now_utc
         subscription = Subscription(
             stripe_subscription_id=unique_sub_id,
             user_id="user_123",
@@ -121,19 +122,18 @@ def test_reconcile_subscription_period_update(db_engine, test_project, test_prod
         test_db.close()
 
 
-def test_reconcile_subscription_no_changes(db_engine, test_project, test_product, test_price):
+def test_reconcile_subscription_no_changes(db_session_factory, test_project, test_product, test_price, now_utc):
     """Test reconciling subscription with no changes."""
     import stripe
-    from sqlalchemy.orm import sessionmaker
     
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     test_db = TestingSessionLocal()
     
     # Use unique IDs to avoid conflicts
     unique_sub_id = f"sub_{uuid.uuid4().hex[:24]}"
     
     try:
-        now = datetime.utcnow()
+        now = now_utc
         period_start = now
         period_end = now + timedelta(days=30)
 
@@ -175,11 +175,71 @@ def test_reconcile_subscription_no_changes(db_engine, test_project, test_product
         test_db.close()
 
 
+@pytest.mark.parametrize(
+    "initial_status,stripe_status,expected_entitlements",
+    [
+        pytest.param(SubscriptionStatus.ACTIVE, "past_due", 0, id="active_to_past_due"),
+        pytest.param(SubscriptionStatus.PAST_DUE, "active", 2, id="past_due_to_active"),
+    ],
+)
+def test_reconcile_subscriptions_for_project_recomputes_entitlements(
+    db_session_factory, test_project, test_product, test_price, now_utc,
+    initial_status, stripe_status, expected_entitlements,
+):
+    """Test a reconciled status change is reflected in the stored entitlements."""
+    import stripe
+
+    user_id = f"user_{uuid.uuid4().hex[:24]}"
+    unique_sub_id = f"sub_{uuid.uuid4().hex[:24]}"
+    test_db = db_session_factory()
+
+    try:
+        test_db.add(
+            Subscription(
+                stripe_subscription_id=unique_sub_id,
+                user_id=user_id,
+                project_id=test_project.id,
+                price_id=test_price.id,
+                status=initial_status,
+                current_period_start=now_utc,
+                current_period_end=now_utc + timedelta(days=30),
+                cancel_at_period_end=False,
+            )
+        )
+        test_db.flush()
+        recompute_and_store_entitlements(test_db, user_id, test_project.id)
+        test_db.commit()
+
+        mock_stripe_sub = Mock()
+        mock_stripe_sub.status = stripe_status
+        mock_stripe_sub.current_period_start = int(now_utc.timestamp())
+        mock_stripe_sub.current_period_end = int((now_utc + timedelta(days=30)).timestamp())
+        mock_stripe_sub.cancel_at_period_end = False
+        mock_stripe_sub.canceled_at = None
+
+        def retrieve(subscription_id):
+            # Other tests' subscriptions in the shared database are left untouched
+            if subscription_id != unique_sub_id:
+                raise stripe.error.InvalidRequestError("No such subscription", "id")
+            return mock_stripe_sub
+
+        with patch("billing_service.reconciliation.stripe.Subscription.retrieve", side_effect=retrieve):
+            reconcile_subscriptions_for_project(test_db, test_project)
+
+        active_entitlements = test_db.query(Entitlement).filter(
+            Entitlement.user_id == user_id,
+            Entitlement.project_id == test_project.id,
+            Entitlement.is_active == True,  # noqa: E712
+        ).count()
+        assert active_entitlements == expected_entitlements
+    finally:
+        test_db.close()
+
+
 @patch("billing_service.reconciliation.SessionLocal")
-def test_reconcile_all_empty_projects(mock_session_local, db_engine):
+def test_reconcile_all_empty_projects(mock_session_local, db_session_factory):
     """Test reconcile_all with no projects."""
-    from sqlalchemy.orm import sessionmaker
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     
     def create_session():
         return TestingSessionLocal()
@@ -196,11 +256,10 @@ def test_reconcile_all_empty_projects(mock_session_local, db_engine):
     assert len(result.errors) == 0 or all(isinstance(e, str) for e in result.errors)
 
 
-def test_reconcile_purchases_for_project_no_purchases(db_engine, test_project):
+def test_reconcile_purchases_for_project_no_purchases(db_session_factory, test_project):
     """Test reconciling purchases when none exist."""
-    from sqlalchemy.orm import sessionmaker
     from billing_service.reconciliation import reconcile_purchases_for_project
-    TestingSessionLocal = sessionmaker(bind=db_engine)
+    TestingSessionLocal = db_session_factory
     test_db = TestingSessionLocal()
     
     try:
@@ -1,10 +1,12 @@
 """Tests for scheduler component."""
 
 import pytest
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import Mock, patch
 from datetime import datetime
 
+from billing_service.reconciliation import ReconciliationResult
 from billing_service.scheduler import (
+    run_reconciliation_job,
     start_reconciliation_scheduler,
     stop_reconciliation_scheduler,
 )
@@ -19,8 +21,22 @@ def test_scheduler_initialization():
     assert callable(stop_reconciliation_scheduler)
 
 
+@pytest.mark.asyncio
+@patch("billing_service.scheduler.reconcile_all", autospec=True)
+async def test_run_reconciliation_job(mock_reconcile):
+    """Test scheduled job calls reconcile_all with its real signature."""
+    expected = ReconciliationResult()
+    mock_reconcile.return_value = expected
+
+    # autospec raises TypeError if the job passes arguments reconcile_all() doesn't accept
+    result = await run_reconciliation_job()
+
+    assert result is expected
+    mock_reconcile.assert_called_once_with()
+
+
 @patch("billing_service.scheduler._scheduler", None)
-@patch("billing_service.scheduler.BackgroundScheduler")
+@patch("billing_service.scheduler.AsyncIOScheduler")
 @patch("billing_service.scheduler.reconcile_all")
 def test_start_reconciliation_scheduler(mock_reconcile, mock_scheduler_class):
     """Test starting reconciliation scheduler."""
@@ -47,7 +63,7 @@ def test_stop_reconciliation_scheduler(mock_scheduler):
 
 
 @patch("billing_service.scheduler._scheduler", None)
-@patch("billing_service.scheduler.BackgroundScheduler")
+@patch("billing_service.scheduler.AsyncIOScheduler")
 @patch("billing_service.scheduler.reconcile_all")
 def test_scheduler_job_configuration(mock_reconcile, mock_scheduler_class):
     """Test scheduler job is configured correctly."""
@@ -72,7 +88,7 @@ def test_scheduler_job_configuration(mock_reconcile, mock_scheduler_class):
 
 
 @patch("billing_service.scheduler._scheduler", None)
-@patch("billing_service.scheduler.BackgroundScheduler")
+@patch("billing_service.scheduler.AsyncIOScheduler")
 @patch("billing_service.scheduler.reconcile_all")
 def test_scheduler_idempotency(mock_reconcile, mock_scheduler_class):
     """Test scheduler can be started multiple times safely."""
@@ -2,7 +2,6 @@
 
 import pytest
 from datetime import datetime
-import hashlib
 
 from billing_service.main import app
 from billing_service.database import get_db
@@ -13,7 +12,7 @@ from billing_service.models import Price, Product, PriceInterval
 @pytest.mark.integration_stripe
 @pytest.mark.asyncio
 async def test_create_checkout_session_real_stripe(
-    client, db_session, test_project, stripe_product, stripe_price
+    client, db_session, test_project, test_api_key, get_db_override, stripe_product, stripe_price
 ):
     """Test creating a checkout session with real Stripe API."""
     # Create a price in our database that references the Stripe price
@@ -40,34 +39,18 @@ async def test_create_checkout_session_real_stripe(
     db_session.commit()
     db_session.refresh(price)
     
-    # Set up API key
-    api_key = "test_checkout_key_real"
-    api_key_hash = hashlib.sha256(api_key.encode()).hexdigest()
-    test_project.api_key_hash = api_key_hash
-    db_session.commit()
-    db_session.refresh(test_project)
-    
     # Override dependencies
-    async def override_get_db():
-        from sqlalchemy.orm import sessionmaker
-        TestingSessionLocal = sessionmaker(bind=db_session.bind)
-        test_session = TestingSessionLocal()
-        try:
-            yield test_session
-        finally:
-            test_session.close()
-    
     async def override_verify():
         return test_project
     
-    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_db] = get_db_override
     app.dependency_overrides[verify_project_api_key] = override_verify
     
     try:
         # Create checkout session with real Stripe API
         response = await client.post(
             "/api/v1/checkout/create",
-            headers={"Authorization": f"Bearer {api_key}"},
+            headers={"Authorization": f"Bearer {test_api_key}"},
             json={
                 "user_id": "user_real_test",
                 "project_id": "test-project",
@@ -0,0 +1,21 @@
+"""Tests for Stripe service integration."""
+
+import stripe
+
+from billing_service.stripe_service import (
+    STRIPE_POOL_MAXSIZE,
+    build_stripe_http_client,
+)
+
+
+def test_default_http_client_is_pooled():
+    """Test Stripe SDK calls go through the shared pooled client."""
+    assert isinstance(stripe.default_http_client, stripe.RequestsClient)
+
+
+def test_build_stripe_http_client_mounts_pooled_adapter():
+    """Test the Stripe HTTP client reuses one pooled HTTPS adapter."""
+    client = build_stripe_http_client()
+
+    adapter = client._session.get_adapter("https://api.stripe.com")
+    assert adapter._pool_maxsize == STRIPE_POOL_MAXSIZE
@@ -20,7 +20,7 @@ def test_verify_stripe_signature_success(mock_construct, mock_settings):
     result = verify_stripe_signature(payload, signature)
 
     assert result == mock_event
-    mock_construct.assert_called_once_with(payload, signature, "whsec_test")
+    mock_construct.assert_called_once_with(payload.decode("utf-8"), signature, "whsec_test")
 
 
 @patch("billing_service.webhook_verification.settings")
@@ -93,7 +93,87 @@ async def test_get_webhook_payload():
     from billing_service.webhook_verification import get_webhook_payload
 
     mock_request = Mock(spec=Request)
+    mock_request.headers = {"content-length": "16"}
     mock_request.body = AsyncMock(return_value=b'{"type": "test"}')
 
     payload = await get_webhook_payload(mock_request)
     assert payload == b'{"type": "test"}'
+
+
+@pytest.mark.asyncio
+async def test_get_webhook_payload_too_large():
+    """Test oversized webhook payloads are rejected before the body is read."""
+    from fastapi import Request, HTTPException
+    from billing_service.webhook_verification import (
+        MAX_WEBHOOK_PAYLOAD_BYTES,
+        get_webhook_payload,
+    )
+
+    mock_request = Mock(spec=Request)
+    mock_request.headers = {"content-length": str(MAX_WEBHOOK_PAYLOAD_BYTES + 1)}
+    mock_request.body = AsyncMock()
+
+    with pytest.raises(HTTPException) as exc_info:
+        await get_webhook_payload(mock_request)
+
+    assert exc_info.value.status_code == 413
+    mock_request.body.assert_not_called()
+
+
+@patch("billing_service.webhook_verification.settings")
+@patch("billing_service.webhook_verification.stripe.Webhook.construct_event")
+def test_verify_stripe_signature_stale_timestamp(mock_construct, mock_settings):
+    """Test stale signature timestamps are rejected without verifying the HMAC."""
+    import time
+    from fastapi import HTTPException
+
+    mock_settings.stripe_webhook_secret = "whsec_test"
+
+    payload = b'{"type": "checkout.session.completed"}'
+    signature = f"t={int(time.time()) - 3600},v1=abc123"
+
+    with pytest.raises(HTTPException) as exc_info:
+        verify_stripe_signature(payload, signature)
+
+    assert exc_info.value.status_code == 401
+    mock_construct.assert_not_called()
+
+
+@patch("billing_service.webhook_verification.settings")
+@patch("billing_service.webhook_verification.stripe.Webhook.construct_event")
+def test_verify_stripe_signature_future_timestamp(mock_construct, mock_settings):
+    """Test future-dated signature timestamps are left to the SDK, which only rejects stale ones."""
+    import time
+
+    mock_settings.stripe_webhook_secret = "whsec_test"
+    mock_construct.return_value = Mock()
+
+    payload = b'{"type": "checkout.session.completed"}'
+    signature = f"t={int(time.time()) + 3600},v1=abc123"
+
+    assert verify_stripe_signature(payload, signature) is mock_construct.return_value
+    mock_construct.assert_called_once_with(payload.decode("utf-8"), signature, "whsec_test")
+
+
+@patch("billing_service.webhook_verification.settings")
+def test_verify_stripe_signature_invalid_utf8(mock_settings):
+    """Test payloads that are not valid UTF-8 are rejected as invalid."""
+    from fastapi import HTTPException
+
+    mock_settings.stripe_webhook_secret = "whsec_test"
+
+    with pytest.raises(HTTPException) as exc_info:
+        verify_stripe_signature(b'{"type": "\xff"}', "v1=abc123")
+
+    assert exc_info.value.status_code == 400
+
+
+def test_get_signature_timestamp():
+    """Test extracting the t= timestamp from Stripe-Signature headers."""
+    from billing_service.webhook_verification import get_signature_timestamp
+
+    assert get_signature_timestamp("t=1492774577,v1=abc,v0=def") == 1492774577
+    assert get_signature_timestamp("v1=abc,v1=def,t=1492774577") == 1492774577
+    assert get_signature_timestamp("v1=abct=123") is None
+    assert get_signature_timestamp("t=notanumber,v1=abc") is None
+    assert get_signature_timestamp("test_signature") is None
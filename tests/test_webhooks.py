@@ -1,17 +1,15 @@
 """Tests for webhook endpoint."""
 
 import pytest
-from unittest.mock import Mock, patch, MagicMock
-from fastapi.testclient import TestClient
+from unittest.mock import Mock, patch
 
-from billing_service.main import app
 from billing_service.webhook_processors import event_router
 
 
 @pytest.fixture
-def client():
-    """Create test client."""
-    return TestClient(app)
+def client(sync_client):
+    """Use the shared synchronous test client for the webhook endpoint."""
+    return sync_client
 
 
 @pytest.fixture